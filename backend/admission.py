@@ -0,0 +1,79 @@
+# filename: admission.py
+# Admission control: bounded in-flight work per request class, a bounded wait queue,
+# and a fast rejection with Retry-After once both are full.
+#
+#   queue full             -> 429 Too Many Requests (rejected without waiting)
+#   waited past the limit  -> 503 Service Unavailable
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code, message, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    def __init__(self, name, max_inflight, max_queue, queue_timeout):
+        self.name = name
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_inflight)
+        self.inflight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+        self.mean_service = 0.0  # moving average of seconds spent inside the gate
+
+    def retry_after(self):
+        # Roughly how long until the current queue has drained, in whole seconds
+        return max(1, math.ceil((self.waiting + 1) * self.mean_service / self.max_inflight))
+
+    @asynccontextmanager
+    async def admit(self):
+        if self._slots.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(429, f"Too many {self.name} requests queued", self.retry_after())
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise Overloaded(503, f"Timed out waiting for a {self.name} slot", self.retry_after())
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+
+        self.inflight += 1
+        self.admitted += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._slots.release()
+            elapsed = time.perf_counter() - start
+            self.completed += 1
+            self.mean_service = elapsed if self.completed == 1 else 0.9 * self.mean_service + 0.1 * elapsed
+
+    def stats(self):
+        return {
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "mean_service_ms": self.mean_service * 1000,
+        }
@@ -1,12 +1,32 @@
-# ✅ Import required libraries
-from fastapi import FastAPI
+# ✅ Import required libraries (numpy, the model, parsers and HTTP clients load on first
+# use or in the background warmup, so importing the app stays fast)
+import startup  # first, so boot timing covers the imports below
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Literal
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import joblib
-import numpy as np
-import pandas as pd
-import xgboost as xgb
 from url_feature_extractor import URLFeatureExtractor  # Custom class to extract features from a raw URL
+from fetcher import page_fetcher  # Shared async HTTP client for downloading pages
+from verdict_cache import VerdictCache
+from url_canonicalizer import canonical_url, respell
+from scan_store import ScanStore
+from batching import MicroBatcher
+from model_registry import ModelRegistry
+from admission import AdmissionGate, Overloaded
+from single_flight import SingleFlight
+import metrics
+from metrics import ServerTimingMiddleware, run_in_context, stage
+from html_parsers import parse_html
+import config
+import hmac
+import logging
+import threading
+
+startup.mark("imports")
 
 # ✅ Initialize FastAPI app
 app = FastAPI()
@@ -18,12 +38,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the extension's page read per-stage timings from cross-origin responses
+    expose_headers=["Server-Timing"],
 )
 
-# ✅ Load the scaler and XGBoost model
-scaler = joblib.load("scaler.pkl")
-booster = xgb.Booster()
-booster.load_model("xgb_model.json")
+# ✅ Per-stage timings for every request: Server-Timing header plus /metrics histograms
+app.add_middleware(ServerTimingMiddleware)
+
+# ✅ Admission control: page fetches and cheap predictions get separate limits, so a burst
+# of slow sites cannot starve /predict; saturated gates answer 429/503 with Retry-After
+url_gate = AdmissionGate("page fetch", config.ADMIT_URL_INFLIGHT, config.ADMIT_URL_QUEUE,
+                         config.ADMIT_URL_QUEUE_TIMEOUT)
+predict_gate = AdmissionGate("predict", config.ADMIT_PREDICT_INFLIGHT, config.ADMIT_PREDICT_QUEUE,
+                             config.ADMIT_PREDICT_QUEUE_TIMEOUT)
+
+@app.exception_handler(Overloaded)
+async def overloaded_response(request: Request, exc: Overloaded):
+    return JSONResponse(status_code=exc.status_code, content={"error": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+# ✅ Concurrent scans of the same uncached URL (a campaign link hitting many users at once)
+# share one fetch and prediction
+url_flights = SingleFlight("url_scan")
+
+# ✅ Page parsing gets its own bounded executor instead of the shared threadpool
+extract_executor = ThreadPoolExecutor(max_workers=config.EXTRACT_THREADS, thread_name_prefix="extract")
+
+# ✅ Recent /predict_url verdicts, keyed on canonical URL: in memory, then on disk (shared by workers)
+verdict_cache = VerdictCache()
+scan_store = ScanStore()
 
 # ✅ Define the expected feature columns in correct order
 FEATURE_COLUMNS = [
@@ -34,6 +77,17 @@ FEATURE_COLUMNS = [
     "LetterToDigitRatio", "Redirect_0", "Redirect_1"
 ]
 
+# ✅ Versioned models, loaded on first use (or in the background warmup) and swappable at
+# runtime through the /admin endpoints; "builtin" is the compiled model next to this file
+MODEL_STEM = "xgb_model_raw"
+# Cached verdicts came from the previous model (the scan store is rescored on read)
+model_registry = ModelRegistry(config.MODEL_DIR, MODEL_STEM, FEATURE_COLUMNS, config.MODEL_VERSION,
+                               on_swap=lambda loaded: verdict_cache.clear())
+
+def models():
+    # Callers keep the returned version for the whole request, so a swap never splits one
+    return model_registry.active
+
 # ✅ Define input model schema for direct feature input
 class URLFeatures(BaseModel):
     URLLength: int
@@ -62,61 +116,429 @@ class URLFeatures(BaseModel):
 # ✅ Define input model for raw URL input
 class URLInput(BaseModel):
     url: str
+    # lexical: URL string only; cascade: URL string first, page fetch only when uncertain
+    mode: Literal["full", "lexical", "cascade"] = "full"
+
+# ✅ Define input model for batch scoring (feature rows and/or raw URLs)
+class BatchInput(BaseModel):
+    features: List[URLFeatures] = []
+    urls: List[str] = []
+    mode: Literal["full", "lexical", "cascade"] = "full"
+
+# ✅ Turn a predicted label into the API verdict
+def verdict(label):
+    return {
+        "prediction": label,
+        "result": "Legitimate" if label == 1 else "Phishing"
+    }
+
+# ✅ Count a returned verdict (or error) for /metrics
+def counted(result, mode):
+    if "result" in result:
+        metrics.PREDICTIONS.inc(result=result["result"], mode=mode)
+    return result
+
+# ✅ Score any number of feature rows with one engine call (from the batcher and the threadpool)
+def score_rows(rows):
+    loaded = models()
+    labels, evaluated = loaded.engine.predict_labels(loaded.feature_buffer.pack(rows))
+    metrics.ROWS_SCORED.inc(len(rows))
+    metrics.TREES_EVALUATED.inc(int(evaluated.sum()))
+    return [int(label) for label in labels]
+
+def score_batch_rows(feature_inputs, rows):
+    # Also converts the request's feature models to dicts here, off the event loop
+    return score_rows([features.dict() for features in feature_inputs] + rows)
+
+# ✅ Concurrent single-row predictions share one engine call per batching window
+batcher = MicroBatcher(score_rows, config.BATCH_WINDOW_ROWS, config.BATCH_WINDOW_MS / 1000)
 
 # ✅ Predict directly from structured features
 @app.post("/predict")
-def predict(features: URLFeatures):
+async def predict(features: URLFeatures):
     try:
-        # Convert to DataFrame with feature names
-        input_df = pd.DataFrame([features.dict()], columns=FEATURE_COLUMNS)
-
-        # Scale using the original scaler
-        scaled_input = scaler.transform(input_df)
+        async with predict_gate.admit():
+            with stage("predict"):
+                label = await batcher.predict(features.dict())
+        return counted(verdict(label), "features")
+    except Overloaded:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
 
-        # Create DMatrix with feature names
-        dmatrix = xgb.DMatrix(scaled_input, feature_names=FEATURE_COLUMNS)
+# ✅ Parse the fetched page and compute features (CPU-bound, runs in the threadpool)
+def extract_features(url, response):
+    extractor = URLFeatureExtractor(url, response=response)
+    return extractor.extract_model_features()
 
-        # Predict
-        pred = booster.predict(dmatrix)
-        label = int(round(pred[0]))
+# ✅ Download without blocking a worker, then extract features using custom extractor
+async def features_for_url(url):
+    """Features for the page at url, plus flags about the page to report with the verdict.
 
-        return {
-            "prediction": label,
-            "result": "Legitimate" if label == 1 else "Phishing"
-        }
+    Features are None when the response is not HTML; the caller scores the URL alone.
+    """
+    page = {}
+    try:
+        with stage("fetch"):
+            response = await page_fetcher.fetch(url)
+        if response.skipped:
+            page["non_html"] = response.skipped
+            page["content_type"] = response.content_type
+            metrics.PAGES_SKIPPED.inc(reason=response.skipped)
+            return None, page
+        if response.truncated:
+            # Scored on the first FETCH_MAX_BYTES (or what arrived before the deadline)
+            page["truncated"] = True
+            metrics.PAGES_TRUNCATED.inc()
+        loop = asyncio.get_running_loop()
+        features = await loop.run_in_executor(extract_executor, run_in_context(extract_features, url, response))
     except Exception as e:
-        return {"error": str(e)}
+        features = {"error": str(e)}
+    if "error" in features:
+        metrics.FETCH_ERRORS.inc()
+    return features, page
+
+# ✅ Score a URL from its string alone: no download, no HTML parsing
+def lexical_score(url):
+    with stage("lexical"):
+        features = URLFeatureExtractor(url, fetch=False).extract_lexical_features()
+        return features, models().lexical.predict(features)
+
+def lexical_verdict(url):
+    features, probability = lexical_score(url)
+    return {"features": features, **verdict(int(round(probability))), "mode": "lexical"}
+
+# ✅ Cascade stage 1: answer from the URL alone when the lexical score is confident
+cascade_stats = {"lexical": 0, "full": 0}
+cascade_stats_lock = threading.Lock()  # batches count from a worker thread
+
+# ✅ Responses that are not HTML (PDFs, executables, images) are scored from the URL alone
+def non_html_verdict(url, page):
+    features, probability = lexical_score(url)
+    return {"features": features, **verdict(int(round(probability))), **page}
+
+def cascade_lexical_verdict(url):
+    features, probability = lexical_score(url)
+    if config.CASCADE_LOW < probability < config.CASCADE_HIGH:
+        # Uncertain: the caller falls through to the full fetch + parse path
+        with cascade_stats_lock:
+            cascade_stats["full"] += 1
+        return None
+    with cascade_stats_lock:
+        cascade_stats["lexical"] += 1
+    return {"features": features, **verdict(int(round(probability))), "mode": "cascade", "stage": "lexical"}
+
+# ✅ Fetch one page of a batch: each fetch is admitted on its own, like a /predict_url scan,
+# and slots caps how many of the batch's fetches hold or wait for the gate at once
+async def fetch_for_batch(url, slots):
+    async with slots:
+        async with url_gate.admit():
+            return await features_for_url(url)
+
+# ✅ URL-only stage of a batch, for every URL in one go (run off the event loop)
+def lexical_batch_verdicts(mode, urls):
+    if mode == "lexical":
+        return [lexical_verdict(url) for url in urls]
+    return [cascade_lexical_verdict(url) for url in urls]  # None where the full path decides
+
+# ✅ Look a URL up in the in-process cache, then in the on-disk scan store
+async def cached_verdict(cache_key):
+    cached = verdict_cache.get(cache_key)
+    metrics.CACHE_LOOKUPS.inc(layer="memory", outcome="miss" if cached is None else "hit")
+    if cached is not None or not scan_store.enabled:
+        return cached
+    with stage("scan_store"):
+        stored = await run_in_threadpool(scan_store.get, cache_key)
+    metrics.CACHE_LOOKUPS.inc(layer="disk", outcome="miss" if stored is None else "hit")
+    if stored is not None:
+        # Features do not depend on the model, so rescoring keeps the store valid across model swaps
+        label = await batcher.predict(stored["features"])
+        cached = {"features": stored["features"], **verdict(label)}
+        verdict_cache.put(cache_key, cached)
+    return cached
+
+# ✅ A cached or shared verdict may have been scanned from another spelling of the URL (same
+# canonical key): recompute the URL-string features for this spelling, rescoring if any changed
+async def verdict_for(url, result):
+    if "error" in result:
+        return result
+    features = respell(result["features"], url)
+    if features == result["features"]:
+        return result
+    if "non_html" in result:
+        label = int(round(models().lexical.predict(features)))
+    else:
+        with stage("predict"):
+            label = await batcher.predict(features)
+    return {**result, "features": features, **verdict(label)}
+
+# ✅ Record a fresh verdict in both caches
+async def remember_verdict(cache_key, result):
+    verdict_cache.put(cache_key, result)
+    # The store keeps page features and rescores them with the full model, so URL-only verdicts stay out
+    if scan_store.enabled and "non_html" not in result:
+        await run_in_threadpool(scan_store.put, cache_key, result["features"], result["prediction"])
+
+# ✅ Full verdict: cached if possible, otherwise fetch the page, extract all features and predict
+async def full_verdict(url):
+    # Serve a recent verdict for the same page without fetching again; tracking parameters,
+    # fragments and host spelling do not make a URL new
+    cache_key = canonical_url(url)
+    cached = await cached_verdict(cache_key)
+    if cached is None:
+        cached = await url_flights.run(cache_key, lambda: scan_url(url, cache_key))
+    return await verdict_for(url, cached)
+
+async def scan_url(url, cache_key):
+    # Only uncached URLs cost a fetch, so only they go through the fetch gate (once per flight)
+    async with url_gate.admit():
+        features, page = await features_for_url(url)
+
+    if features is None:
+        result = non_html_verdict(url, page)
+        await remember_verdict(cache_key, result)
+        return result
+    if "error" in features:
+        return {"error": features["error"]}
+
+    with stage("predict"):
+        label = await batcher.predict(features)
+    result = {"features": features, **verdict(label), **page}
+    await remember_verdict(cache_key, result)
+    return result
 
 # ✅ Predict from raw URL using feature extractor
 @app.post("/predict_url")
-def predict_from_url(input_data: URLInput):
+async def predict_from_url(input_data: URLInput):
+    mode = input_data.mode
+    try:
+        if mode == "lexical":
+            return counted(lexical_verdict(input_data.url), mode)
+
+        if mode == "cascade":
+            decided = cascade_lexical_verdict(input_data.url)
+            if decided is not None:
+                return counted(decided, mode)
+            result = await full_verdict(input_data.url)
+            if "error" in result:
+                return result
+            stage_used = "lexical" if "non_html" in result else "full"
+            return counted({**result, "mode": "cascade", "stage": stage_used}, mode)
+
+        return counted(await full_verdict(input_data.url), mode)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
+
+# ✅ Predict many feature rows and URLs at once; errors are reported per item
+@app.post("/predict_batch")
+async def predict_batch(batch: BatchInput):
+    if len(batch.features) + len(batch.urls) > config.BATCH_MAX_ITEMS:
+        return {"error": f"Batch too large: at most {config.BATCH_MAX_ITEMS} items"}
+
     try:
-        # Extract features using custom extractor
-        extractor = URLFeatureExtractor(input_data.url)
-        features = extractor.extract_model_features()
+        # Answer cached URLs directly; fetch and extract the rest concurrently
+        url_results = []
+        pending = []
+        lexical_results = [None] * len(batch.urls)
+        if batch.mode in ("lexical", "cascade") and batch.urls:
+            # tld lookups and the lexical model for the whole batch, in one threadpool call
+            lexical_results = await run_in_threadpool(
+                run_in_context(lexical_batch_verdicts, batch.mode, batch.urls))
+        for url, decided in zip(batch.urls, lexical_results):
+            if batch.mode == "lexical":
+                url_results.append({"url": url, **decided})
+                continue
+            cascade_stage = {}
+            if batch.mode == "cascade":
+                if decided is not None:
+                    url_results.append({"url": url, **decided})
+                    continue
+                cascade_stage = {"mode": "cascade", "stage": "full"}
+            cached = await cached_verdict(canonical_url(url))
+            if cached is not None:
+                cached = await verdict_for(url, cached)
+            result = {"url": url, **cached, **cascade_stage} if cached is not None else {"url": url, **cascade_stage}
+            if "non_html" in result and "stage" in result:
+                result["stage"] = "lexical"
+            url_results.append(result)
+            if cached is None:
+                pending.append(result)
+
+        # Spellings that share a canonical key are fetched once; the others are respelled
+        fetch_urls = {}
+        for result in pending:
+            fetch_urls.setdefault(canonical_url(result["url"]), result["url"])
+        fetched = {}
+        if fetch_urls:
+            slots = asyncio.Semaphore(config.BATCH_FETCH_CONCURRENCY)
+            tasks = [asyncio.ensure_future(fetch_for_batch(url, slots)) for url in fetch_urls.values()]
+            try:
+                fetched = dict(zip(fetch_urls, await asyncio.gather(*tasks)))
+            except Overloaded:
+                for task in tasks:
+                    task.cancel()
+                raise
+        url_features = []
+        for result in pending:
+            cache_key = canonical_url(result["url"])
+            features, page = fetched[cache_key]
+            if features is not None and "error" not in features and result["url"] != fetch_urls[cache_key]:
+                features = respell(features, result["url"])
+            url_features.append((features, page))
+        for result, (features, page) in zip(pending, url_features):
+            result.update(page)
+            if features is None:
+                result.update(non_html_verdict(result["url"], page))
+                if "stage" in result:
+                    result["stage"] = "lexical"
+            elif "error" in features:
+                result.pop("mode", None)
+                result.pop("stage", None)
+                result["error"] = features["error"]
+            else:
+                result["features"] = features
 
-        if "error" in features:
-            return {"error": features["error"]}
+        feature_results = [{} for _ in batch.features]
 
-        # Convert to DataFrame to align with expected column names
-        input_df = pd.DataFrame([features], columns=FEATURE_COLUMNS)
+        # Collect every scorable row so the whole batch goes through the model together
+        url_rows, targets = [], list(feature_results)
+        for result in pending:
+            if "features" in result and "non_html" not in result:
+                url_rows.append(result["features"])
+                targets.append(result)
 
-        # Scale
-        scaled_input = scaler.transform(input_df)
+        if targets:
+            # The model call runs off the event loop, under the same admission as /predict
+            async with predict_gate.admit():
+                with stage("predict"):
+                    labels = await run_in_threadpool(score_batch_rows, batch.features, url_rows)
+            for result, label in zip(targets, labels):
+                result.update(verdict(label))
 
-        # Predict with DMatrix
-        dmatrix = xgb.DMatrix(scaled_input, feature_names=FEATURE_COLUMNS)
-        pred = booster.predict(dmatrix)
-        label = int(round(pred[0]))
+        for result, (_, page) in zip(pending, url_features):
+            if "prediction" in result:
+                await remember_verdict(canonical_url(result["url"]), {
+                    "features": result["features"],
+                    **verdict(result["prediction"]),
+                    **page
+                })
 
-        return {
-            "features": features,
-            "prediction": label,
-            "result": "Legitimate" if label == 1 else "Phishing"
-        }
+        for result in feature_results:
+            counted(result, "features")
+        for result in url_results:
+            counted(result, batch.mode)
+        return {"features": feature_results, "urls": url_results}
+    except Overloaded:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
+# ✅ Load the model and heavy dependencies off the request path, right after boot
+def warm_up():
+    try:
+        with startup.timed("warmup"):
+            models()
+            URLFeatureExtractor("http://example.com/", fetch=False).extract_lexical_features()
+            parse_html("<html><title>warmup</title></html>")
+            import httpx  # noqa: F401  imported now so the first fetch does not pay for it
+    except Exception:
+        # Not fatal: whatever failed is loaded again (and reported) by the first request
+        logging.getLogger(__name__).exception("warmup failed")
+
+# ✅ Periodically drop expired rows from the on-disk scan store
+async def compact_scan_store():
+    while True:
+        await run_in_threadpool(scan_store.compact)
+        await asyncio.sleep(config.SCAN_DB_COMPACT_INTERVAL)
+
+@app.on_event("startup")
+async def start_compaction():
+    if scan_store.enabled:
+        app.state.compaction = asyncio.create_task(compact_scan_store())
+    if config.WARMUP:
+        threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+    startup.mark("app startup")
+    startup.log_report()
+
+# ✅ Release pooled connections on shutdown
+@app.on_event("shutdown")
+async def close_fetcher():
+    compaction = getattr(app.state, "compaction", None)
+    if compaction is not None:
+        compaction.cancel()
+    await page_fetcher.close()
+    extract_executor.shutdown(wait=False)
+
+# ✅ Admin: list, preload, activate and roll back model versions without a restart
+def require_admin(token):
+    if not config.ADMIN_TOKEN or not hmac.compare_digest((token or "").encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/models")
+def list_models(x_admin_token: str = Header(None)):
+    require_admin(x_admin_token)
+    return model_registry.describe()
+
+@app.post("/admin/models/{version}/load")
+async def load_model(version: str, x_admin_token: str = Header(None)):
+    require_admin(x_admin_token)
+    try:
+        await run_in_threadpool(model_registry.load, version)
+    except Exception as e:
+        return {"error": str(e)}
+    return model_registry.describe()
+
+@app.post("/admin/models/{version}/activate")
+async def activate_model(version: str, x_admin_token: str = Header(None)):
+    require_admin(x_admin_token)
+    try:
+        # Loading and warming happen in the threadpool; serving continues on the old version
+        await run_in_threadpool(model_registry.activate, version)
+    except Exception as e:
+        return {"error": str(e)}
+    return model_registry.describe()
+
+@app.post("/admin/models/rollback")
+async def rollback_model(x_admin_token: str = Header(None)):
+    require_admin(x_admin_token)
+    try:
+        await run_in_threadpool(model_registry.rollback)
+    except Exception as e:
+        return {"error": str(e)}
+    return model_registry.describe()
+
+# ✅ Prometheus metrics: latency histograms and counters, plus current queue and cache gauges
+@app.get("/metrics")
+def read_metrics():
+    gauges = ["# HELP phishshield_admission_inflight Requests running inside each admission gate.",
+              "# TYPE phishshield_admission_inflight gauge"]
+    gauges += [f'phishshield_admission_inflight{{gate="{gate.name}"}} {gate.inflight}' for gate in (url_gate, predict_gate)]
+    gauges += ["# HELP phishshield_admission_waiting Requests queued at each admission gate.",
+               "# TYPE phishshield_admission_waiting gauge"]
+    gauges += [f'phishshield_admission_waiting{{gate="{gate.name}"}} {gate.waiting}' for gate in (url_gate, predict_gate)]
+    gauges += ["# HELP phishshield_verdict_cache_entries Verdicts held in the in-process cache.",
+               "# TYPE phishshield_verdict_cache_entries gauge",
+               f"phishshield_verdict_cache_entries {verdict_cache.stats()['size']}"]
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+# ✅ Cache and cascade statistics
+@app.get("/stats")
+def read_stats():
+    rows_scored = metrics.ROWS_SCORED.value()
+    return {
+        "verdict_cache": verdict_cache.stats(),
+        "scan_store": scan_store.stats(),
+        "cascade_decided_by": cascade_stats,
+        "micro_batching": batcher.stats(),
+        "admission": {"page_fetch": url_gate.stats(), "predict": predict_gate.stats()},
+        "coalescing": url_flights.stats(),
+        "trees_per_row": metrics.TREES_EVALUATED.value() / rows_scored if rows_scored else 0.0,
+        "startup": startup.report(),
+        "model_version": model_registry.active.version,
+    }
+
 # ✅ Root endpoint
 @app.get("/")
 def read_root():
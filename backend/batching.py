@@ -0,0 +1,73 @@
+# filename: batching.py
+# Coalesces concurrent single-row predictions into one model call.
+#
+# The first row to arrive opens a window. The window closes after `max_wait` seconds,
+# or as soon as `max_rows` rows are waiting. Then the whole batch is scored with a single
+# predict call in the threadpool, and each caller gets its own result back.
+
+import asyncio
+
+from fastapi.concurrency import run_in_threadpool
+
+
+class MicroBatcher:
+    def __init__(self, predict_rows, max_rows, max_wait):
+        self.predict_rows = predict_rows  # list of rows -> list of results, same order
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self._pending = []  # (row, future)
+        self._timer = None
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+
+    @property
+    def enabled(self):
+        return self.max_rows > 1 and self.max_wait > 0
+
+    async def predict(self, row):
+        if not self.enabled:
+            return (await run_in_threadpool(self.predict_rows, [row]))[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.rows += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            results = await run_in_threadpool(self.predict_rows, [row for row, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # A caller that went away (client disconnect) has a cancelled future
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_rows": self.max_rows,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch": self.rows / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
@@ -0,0 +1,150 @@
+# filename: benchmark.py
+# Latency and CPU cost of the scoring engines under concurrent callers.
+#
+# Usage: python benchmark.py [--model xgb_model_raw.json] [--callers 8] [--calls 500] [--nthread 1]
+#        python benchmark.py --pages PAGES_DIR
+#
+# Each scenario starts `callers` threads (like the uvicorn threadpool). Every thread
+# scores `calls` single rows back to back, then one 1000-row batch is timed on its own.
+# The CPU column is process CPU time per call: above wall time per call means threads
+# are competing for cores.
+#
+# --pages instead times turning saved pages (*.html, *.htm) into text as if they had
+# been served without a charset: requests' response.text, which detects one, against
+# the fetcher's charset policy.
+
+import argparse
+import os
+import statistics
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from inference import load_engine
+from tree_ensemble import TreeEnsemble
+
+
+def sample_rows(model_path, n_rows, seed=0):
+    # Values drawn around the model's own split thresholds so every tree path gets used
+    ensemble = TreeEnsemble.load(model_path)
+    is_split = ensemble.left != np.arange(len(ensemble.left))
+    rng = np.random.default_rng(seed)
+    n_features = len(ensemble.feature_names)
+    rows = np.zeros((n_rows, n_features), dtype=np.float32)
+    for f in range(n_features):
+        values = ensemble.threshold[is_split & (ensemble.feature == f)]
+        if len(values):
+            rows[:, f] = rng.choice(values, n_rows) * rng.uniform(0, 2, n_rows)
+    return rows, ensemble.feature_names
+
+
+class DMatrixScorer:
+    """The previous serving path: a new DMatrix per call, default nthread."""
+
+    def __init__(self, path, feature_columns):
+        import xgboost as xgb
+        self._xgb = xgb
+        self.feature_columns = feature_columns
+        self.booster = xgb.Booster()
+        self.booster.load_model(path)
+
+    def predict(self, matrix):
+        return self.booster.predict(self._xgb.DMatrix(matrix, feature_names=self.feature_columns))
+
+
+def run_scenario(scorer, rows, callers, calls):
+    latencies = [[] for _ in range(callers)]
+
+    def caller(i):
+        local = latencies[i]
+        for j in range(calls):
+            row = rows[(i * calls + j) % len(rows)][None, :]
+            start = time.perf_counter()
+            scorer.predict(row)
+            local.append(time.perf_counter() - start)
+
+    scorer.predict(rows[:1])  # warm-up
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(callers)]
+    wall, cpu = time.perf_counter(), time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    total = callers * calls
+    flat = sorted(t for local in latencies for t in local)
+    batch = rows[:1000]
+    start = time.perf_counter()
+    scorer.predict(batch)
+    batch_time = time.perf_counter() - start
+    return {
+        "p50_us": statistics.median(flat) * 1e6,
+        "p99_us": flat[int(0.99 * (len(flat) - 1))] * 1e6,
+        "throughput": total / wall,
+        "cpu_us": cpu / total * 1e6,
+        "batch_ms": batch_time * 1e3,
+    }
+
+
+def undeclared_response(content):
+    import requests
+    # No Content-Type at all, so requests falls back to charset detection for .text
+    response = requests.Response()
+    response._content = content
+    response.status_code = 200
+    return response
+
+
+def run_decoding(pages_dir, repeat=5):
+    from fetcher import decode_page
+    pages = [p.read_bytes() for p in sorted(Path(pages_dir).iterdir()) if p.suffix in ('.html', '.htm')]
+    scenarios = [
+        ("requests response.text (detection)", lambda content: undeclared_response(content).text),
+        ("charset policy (decode_page)", decode_page),
+    ]
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / 1024:.0f} KB, no declared charset")
+    print(f"{'scenario':36} {'per page us':>12} {'MB/s':>8}")
+    for name, decode in scenarios:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for content in pages:
+                decode(content)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{name:36} {elapsed / len(pages) * 1e6:12.0f} {sum(map(len, pages)) / elapsed / 1e6:8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure latency and CPU cost of the scoring engines.")
+    parser.add_argument('--model', default='xgb_model_raw.json')
+    parser.add_argument('--callers', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--nthread', type=int, default=1)
+    parser.add_argument('--pages', help='time page decoding on the saved pages in this directory instead')
+    args = parser.parse_args(argv)
+
+    if args.pages:
+        run_decoding(args.pages)
+        return
+
+    rows, feature_columns = sample_rows(args.model, 5000)
+    stem = os.path.splitext(args.model)[0]
+    scenarios = [
+        ("xgboost DMatrix, default nthread", DMatrixScorer(args.model, feature_columns)),
+        (f"xgboost inplace, nthread={args.nthread}",
+         load_engine("xgboost", stem, feature_columns, nthread=args.nthread)),
+        ("numpy", load_engine("numpy", stem, feature_columns)),
+    ]
+
+    print(f"{os.cpu_count()} cores, {args.callers} callers x {args.calls} single-row calls")
+    print(f"{'scenario':36} {'p50 us':>8} {'p99 us':>8} {'calls/s':>9} {'cpu us':>8} {'1000 rows ms':>13}")
+    for name, scorer in scenarios:
+        r = run_scenario(scorer, rows, args.callers, args.calls)
+        print(f"{name:36} {r['p50_us']:8.0f} {r['p99_us']:8.0f} {r['throughput']:9.0f} "
+              f"{r['cpu_us']:8.0f} {r['batch_ms']:13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# filename: canonical_parity.py
+# Checks that serving one scan to every spelling of a URL gives the features a direct scan
+# of that spelling would.
+#
+# Usage: python canonical_parity.py [PAGES_DIR] [--url URL]
+#
+# Each *.html / *.htm file in PAGES_DIR (parity_pages/ by default) is scanned as if
+# fetched from URL and from variants of it that share URL's canonical key (scheme case,
+# fragment, tracking parameters; host case and default port too with
+# PHISHSHIELD_CANONICAL_FOLD_HOST=1). The first scan is respelled for every other
+# variant, as the verdict cache does, and compared with scanning that variant directly.
+# Exits non-zero on any drift, or if a variant does not share the key.
+#
+# It then turns host folding on for FOLD_HOST_DRIFT_PAGE, whose links point at its own
+# host with absolute URLs, and expects the self/external link counts to drift: that is
+# why PHISHSHIELD_CANONICAL_FOLD_HOST is off by default.
+
+import argparse
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+import config
+from parser_parity import PAGES_DIR, SavedPage
+from url_canonicalizer import canonical_url, respell
+from url_feature_extractor import URLFeatureExtractor
+
+FOLD_HOST_DRIFT_PAGE = Path(PAGES_DIR) / 'absolute_self_links.html'
+FOLD_HOST_DRIFT_COLUMNS = {'NoOfSelfRef', 'NoOfExternalRef'}
+
+
+def spellings(url):
+    parts = urlsplit(url)
+    joiner = '&' if parts.query else '?'
+    variants = [
+        url,
+        url + '#section-2',
+        url + joiner + 'utm_source=newsletter&utm_medium=email&utm_campaign=spring',
+        url + joiner + 'fbclid=IwAR2xF0q9z_8Kd1',
+        urlunsplit((parts.scheme.upper(), parts.netloc, parts.path, parts.query, '')),
+    ]
+    if config.CANONICAL_FOLD_HOST:
+        port = {'http': ':80', 'https': ':443'}.get(parts.scheme, '')
+        variants.append(urlunsplit((parts.scheme, parts.netloc.upper(), parts.path, parts.query, '')))
+        variants.append(urlunsplit((parts.scheme, parts.netloc + port, parts.path, parts.query, '')))
+    return variants
+
+
+def check_page(content, url):
+    """(variant, column, direct value, respelled value) for every feature that drifts."""
+    variants = spellings(url)
+    scanned = URLFeatureExtractor(variants[0], response=SavedPage(content)).extract_model_features()
+    drift = []
+    for variant in variants:
+        if canonical_url(variant) != canonical_url(url):
+            drift.append((variant, 'canonical key', canonical_url(url), canonical_url(variant)))
+            continue
+        direct = URLFeatureExtractor(variant, response=SavedPage(content)).extract_model_features()
+        served = respell(scanned, variant)
+        drift.extend((variant, column, direct[column], served.get(column))
+                     for column in direct if served.get(column) != direct[column])
+    return drift
+
+
+@contextmanager
+def host_folding(enabled):
+    saved = config.CANONICAL_FOLD_HOST
+    config.CANONICAL_FOLD_HOST = int(enabled)
+    try:
+        yield
+    finally:
+        config.CANONICAL_FOLD_HOST = saved
+
+
+def fold_host_drift(url):
+    """Columns that drift on FOLD_HOST_DRIFT_PAGE once host case and default ports are folded."""
+    with host_folding(True):
+        return {column for _, column, _, _ in check_page(FOLD_HOST_DRIFT_PAGE.read_bytes(), url)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that verdicts shared between URL spellings stay exact.")
+    parser.add_argument('pages_dir', nargs='?', default=PAGES_DIR)
+    parser.add_argument('--url', default='https://example.com/login?id=7')
+    args = parser.parse_args(argv)
+
+    pages = sorted(p for p in Path(args.pages_dir).iterdir() if p.suffix in ('.html', '.htm'))
+    mismatches = 0
+    for path in pages:
+        for variant, column, expected, actual in check_page(path.read_bytes(), args.url):
+            mismatches += 1
+            print(f"{path.name}: {variant} {column} direct={expected} served={actual}")
+
+    print(f"{len(pages)} pages, {len(spellings(args.url))} spellings, {mismatches} mismatching features")
+
+    drifted = fold_host_drift(args.url)
+    print(f"with host folding, {FOLD_HOST_DRIFT_PAGE.name} drifts in: {', '.join(sorted(drifted)) or 'nothing'}")
+    if drifted != FOLD_HOST_DRIFT_COLUMNS:
+        print(f"expected exactly {', '.join(sorted(FOLD_HOST_DRIFT_COLUMNS))}; "
+              "revisit the PHISHSHIELD_CANONICAL_FOLD_HOST default")
+        mismatches += 1
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# filename: check_startup.py
+# Fails (exit 1) when a cold `import app` is over the startup budget, or when it
+# imports a heavy dependency that should only load on first use or during warmup.
+#
+# Usage: python check_startup.py [--budget-ms 1500] [--runs 3]
+#   the budget defaults to PHISHSHIELD_STARTUP_BUDGET_MS; the best of N runs is compared
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import config
+
+HEAVY_MODULES = [
+    "numpy", "pandas", "xgboost", "sklearn", "joblib",
+    "bs4", "lxml", "selectolax", "requests", "httpx", "tld",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"import_ms": elapsed * 1000, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def cold_import(env):
+    # A fresh interpreter each time, so nothing is already imported or cached in memory
+    start_env = {**os.environ, **env}
+    out = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True,
+                         check=True, env=start_env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail when a cold import of the app is over budget or loads a heavy dependency.")
+    parser.add_argument('--budget-ms', type=float, default=config.STARTUP_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    results = [cold_import({"PHISHSHIELD_WARMUP": "0"}) for _ in range(args.runs)]
+    best = min(r["import_ms"] for r in results)
+    loaded = sorted(set(m for r in results for m in r["loaded"]))
+    print(f"cold import app: best {best:.0f} ms of {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if best > args.budget_ms:
+        print(f"FAIL: over budget by {best - args.budget_ms:.0f} ms")
+        failed = True
+    if loaded:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(loaded)}")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
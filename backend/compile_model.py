@@ -0,0 +1,162 @@
+# filename: compile_model.py
+# Folds the StandardScaler into the booster's split thresholds, so serving needs no scaler.
+#
+# Usage: python compile_model.py [--model xgb_model.json] [--scaler scaler.pkl] [--out xgb_model_raw.json]
+#
+# Next to the JSON it writes the artifacts the server boots from, so startup needs
+# neither scikit-learn nor a JSON parse of the trees:
+#   xgb_model_raw.ubj - binary (UBJSON) booster for the xgboost engine
+#   xgb_model_raw.npz - flattened trees for the numpy engine plus the lexical model boxes
+#
+# A tree only ever asks "is scaled_x < t?". Scaling is monotonic, so the same question
+# can be asked of the raw value against a raw-space threshold. The new threshold is chosen
+# as the exact float32 boundary: for every float32 input, the raw comparison goes the same
+# way as the scaled one did. The compiled model is checked against scaler + original
+# booster on random and boundary inputs before it is written.
+
+import argparse
+import json
+import os
+import sys
+import warnings
+
+import joblib
+import numpy as np
+import xgboost as xgb
+
+from lexical_model import LexicalModel
+from tree_ensemble import TreeEnsemble
+
+TOLERANCE = 1e-6
+
+
+def scaler_arrays(scaler):
+    n = scaler.n_features_in_
+    mean = np.asarray(scaler.mean_, dtype=np.float64) if scaler.with_mean else np.zeros(n)
+    scale = np.asarray(scaler.scale_, dtype=np.float64) if scaler.with_std else np.ones(n)
+    return mean, scale
+
+
+def raw_threshold(threshold, mean, scale):
+    """Smallest float32 r with: x < r  <=>  float32((x - mean) / scale) < threshold."""
+    threshold = np.float32(threshold)
+
+    def goes_left(x):
+        return np.float32((np.float64(x) - mean) / scale) < threshold
+
+    r = np.float32(np.float64(threshold) * scale + mean)
+    while goes_left(r):
+        r = np.nextafter(r, np.float32(np.inf))
+    while not goes_left(np.nextafter(r, np.float32(-np.inf))):
+        r = np.nextafter(r, np.float32(-np.inf))
+    return r
+
+
+def fold_scaler(model_json, mean, scale):
+    for tree in model_json['learner']['gradient_booster']['model']['trees']:
+        conditions = tree['split_conditions']
+        for node, (left, feature) in enumerate(zip(tree['left_children'], tree['split_indices'])):
+            if left == -1:
+                continue  # leaf: split_conditions holds the leaf value
+            conditions[node] = float(raw_threshold(conditions[node], mean[feature], scale[feature]))
+    return model_json
+
+
+def thresholds_by_feature(model_json, n_features):
+    found = [set() for _ in range(n_features)]
+    for tree in model_json['learner']['gradient_booster']['model']['trees']:
+        for left, feature, condition in zip(tree['left_children'], tree['split_indices'], tree['split_conditions']):
+            if left != -1:
+                found[feature].add(condition)
+    return [np.array(sorted(values)) for values in found]
+
+
+def verification_rows(folded_json, n_features, rng, n_random=20000):
+    # Random rows in a generous range around the training data, plus every raw threshold
+    # and its float32 neighbours, where a rounding mistake would show up
+    thresholds = thresholds_by_feature(folded_json, n_features)
+    random_rows = np.zeros((n_random, n_features))
+    for f, values in enumerate(thresholds):
+        if len(values):
+            random_rows[:, f] = rng.choice(values, n_random) * rng.uniform(0, 2, n_random)
+    blocks = [random_rows, np.rint(random_rows)]
+    for f, values in enumerate(thresholds):
+        points = values.astype(np.float32)
+        points = np.concatenate([
+            points,
+            np.nextafter(points, np.float32(np.inf)),
+            np.nextafter(points, np.float32(-np.inf)),
+        ])
+        block = random_rows[rng.integers(0, n_random, len(points))].copy()
+        block[:, f] = points
+        blocks.append(block)
+    return np.vstack(blocks)
+
+
+def verify(original, folded, scaler, feature_names, rows):
+    with warnings.catch_warnings():
+        # The scaler was fitted on a DataFrame; the plain array holds the same columns
+        warnings.simplefilter('ignore', UserWarning)
+        scaled = scaler.transform(rows)
+    expected = original.predict(xgb.DMatrix(scaled, feature_names=feature_names))
+    actual = folded.predict(xgb.DMatrix(rows, feature_names=feature_names))
+    max_diff = float(np.abs(expected - actual).max())
+    label_mismatches = int((np.round(expected) != np.round(actual)).sum())
+    return max_diff, label_mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fold the scaler into the booster and write the serving artifacts.")
+    parser.add_argument('--model', default='xgb_model.json')
+    parser.add_argument('--scaler', default='scaler.pkl')
+    parser.add_argument('--out', default='xgb_model_raw.json')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with open(args.model) as f:
+        model_json = json.load(f)
+    scaler = joblib.load(args.scaler)
+    mean, scale = scaler_arrays(scaler)
+    feature_names = model_json['learner']['feature_names']
+
+    folded_json = fold_scaler(json.loads(json.dumps(model_json)), mean, scale)
+
+    original = xgb.Booster()
+    original.load_model(args.model)
+    folded = xgb.Booster()
+    folded.load_model(bytearray(json.dumps(folded_json), 'utf-8'))
+
+    rows = verification_rows(folded_json, len(feature_names), np.random.default_rng(args.seed))
+    max_diff, label_mismatches = verify(original, folded, scaler, feature_names, rows)
+    print(f"verified on {len(rows)} rows: max |p - p_folded| = {max_diff:.3g}, label mismatches = {label_mismatches}")
+    if max_diff > TOLERANCE or label_mismatches:
+        print("compiled model is not equivalent; nothing written", file=sys.stderr)
+        return 1
+
+    # Everything is built before the first write, so a failure here leaves no partial version
+    raw_json = json.dumps(folded_json, separators=(',', ':')).encode()
+    raw_ubj = folded.save_raw('ubj')
+    arrays = {
+        **TreeEnsemble(folded_json).to_arrays(),
+        **LexicalModel(folded_json, feature_names).to_arrays(),
+    }
+
+    stem = os.path.splitext(args.out)[0]
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)  # e.g. a new model/<version>/
+    write_atomic(args.out, lambda f: f.write(raw_json))
+    write_atomic(stem + '.ubj', lambda f: f.write(raw_ubj))
+    write_atomic(stem + '.npz', lambda f: np.savez(f, **arrays))
+    print(f"wrote {args.out}, {stem}.ubj, {stem}.npz")
+    return 0
+
+
+def write_atomic(path, write):
+    # Write next to the target and rename, so a running server never sees half a file
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# filename: config.py
+# Runtime settings for the backend, read once from environment variables.
+
+import os
+
+
+def env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def env_str(name, default):
+    return os.environ.get(name, default)
+
+
+# ✅ Outbound page fetching
+FETCH_TIMEOUT = env_float("PHISHSHIELD_FETCH_TIMEOUT", 10)
+FETCH_MAX_CONCURRENCY = env_int("PHISHSHIELD_FETCH_MAX_CONCURRENCY", 256)
+FETCH_MAX_CONNECTIONS = env_int("PHISHSHIELD_FETCH_MAX_CONNECTIONS", 256)
+FETCH_MAX_KEEPALIVE = env_int("PHISHSHIELD_FETCH_MAX_KEEPALIVE", 64)
+FETCH_KEEPALIVE_EXPIRY = env_float("PHISHSHIELD_FETCH_KEEPALIVE_EXPIRY", 30)
+FETCH_USER_AGENT = env_str("PHISHSHIELD_FETCH_USER_AGENT", "Mozilla/5.0")
+# Page bodies: bytes kept per page (the rest is never downloaded) and seconds allowed for the body
+FETCH_MAX_BYTES = env_int("PHISHSHIELD_FETCH_MAX_BYTES", 512 * 1024)
+FETCH_BODY_DEADLINE = env_float("PHISHSHIELD_FETCH_BODY_DEADLINE", 10)
+# Bodies declared larger than this are not downloaded (downloads, not pages); the URL is scored alone
+FETCH_SKIP_LENGTH = env_int("PHISHSHIELD_FETCH_SKIP_LENGTH", 10 * 1024 * 1024)
+# Charset for pages that declare none (no byte order mark, Content-Type charset or <meta>)
+FETCH_DEFAULT_CHARSET = env_str("PHISHSHIELD_FETCH_DEFAULT_CHARSET", "utf-8")
+
+# ✅ Blocking (requests) session pools: number of hosts kept and connections per host
+SESSION_POOL_HOSTS = env_int("PHISHSHIELD_SESSION_POOL_HOSTS", 100)
+SESSION_POOL_PER_HOST = env_int("PHISHSHIELD_SESSION_POOL_PER_HOST", 10)
+
+# ✅ Most items (feature rows + URLs) accepted by one /predict_batch call, and most page
+# fetches one batch may have admitted or queued at the fetch gate at a time
+BATCH_MAX_ITEMS = env_int("PHISHSHIELD_BATCH_MAX_ITEMS", 1000)
+BATCH_FETCH_CONCURRENCY = env_int("PHISHSHIELD_BATCH_FETCH_CONCURRENCY", 16)
+
+# ✅ In-process verdict cache for /predict_url
+VERDICT_CACHE_SIZE = env_int("PHISHSHIELD_VERDICT_CACHE_SIZE", 10000)
+VERDICT_CACHE_TTL = env_float("PHISHSHIELD_VERDICT_CACHE_TTL", 300)
+
+# ✅ URL canonicalization for cache and coalescing keys (see url_canonicalizer.py)
+# Query parameters dropped from the key: comma-separated names, * wildcards allowed
+CANONICAL_DROP_PARAMS = env_str("PHISHSHIELD_CANONICAL_DROP_PARAMS",
+                                "utm_*,fbclid,gclid,dclid,gbraid,wbraid,msclkid,yclid,mc_cid,mc_eid,igshid,_ga,_gl")
+CANONICAL_DROP_FRAGMENT = env_int("PHISHSHIELD_CANONICAL_DROP_FRAGMENT", 1)
+# Lowercase the host and drop :80 / :443 (page links are classified against the host as
+# spelled, so pages linking to their own host absolutely can score differently: off by default)
+CANONICAL_FOLD_HOST = env_int("PHISHSHIELD_CANONICAL_FOLD_HOST", 0)
+# /login/ and /login share a key (servers may answer them differently, so off by default)
+CANONICAL_TRAILING_SLASH = env_int("PHISHSHIELD_CANONICAL_TRAILING_SLASH", 0)
+
+# ✅ On-disk scan store shared by all workers on a node (empty path disables it)
+SCAN_DB_PATH = env_str("PHISHSHIELD_SCAN_DB", "scan_cache.sqlite3")
+SCAN_DB_TTL = env_float("PHISHSHIELD_SCAN_DB_TTL", 3600)
+SCAN_DB_COMPACT_INTERVAL = env_float("PHISHSHIELD_SCAN_DB_COMPACT_INTERVAL", 600)
+SCAN_DB_BUSY_TIMEOUT = env_float("PHISHSHIELD_SCAN_DB_BUSY_TIMEOUT", 5)
+
+# ✅ Cascade mode: lexical probabilities inside (LOW, HIGH) are too uncertain and trigger a page fetch
+CASCADE_LOW = env_float("PHISHSHIELD_CASCADE_LOW", 0.05)
+CASCADE_HIGH = env_float("PHISHSHIELD_CASCADE_HIGH", 0.95)
+
+# ✅ HTML parser backend: "html.parser" (BeautifulSoup), "lxml" or "lexbor" (selectolax)
+PARSER_BACKEND = env_str("PHISHSHIELD_PARSER", "html.parser")
+
+# ✅ Model evaluator: "numpy" (flattened trees, no xgboost import) or "xgboost" (Booster + DMatrix)
+INFERENCE_ENGINE = env_str("PHISHSHIELD_ENGINE", "numpy")
+# Threads per xgboost predict call in each worker (keep workers x threads <= cores)
+INFERENCE_THREADS = env_int("PHISHSHIELD_ENGINE_THREADS", 1)
+# numpy engine: check for an early decision after every N trees (0 sums all trees; with this
+# model's leaf ranges the checks usually cost more than the trees they skip)
+EARLY_EXIT_CHUNK = env_int("PHISHSHIELD_EARLY_EXIT_CHUNK", 0)
+
+# ✅ Micro-batching of single predictions: a batch closes after WINDOW_MS or at WINDOW_ROWS rows
+# (WINDOW_MS=0 or WINDOW_ROWS<=1 scores every request on its own)
+BATCH_WINDOW_MS = env_float("PHISHSHIELD_BATCH_WINDOW_MS", 2)
+BATCH_WINDOW_ROWS = env_int("PHISHSHIELD_BATCH_WINDOW_ROWS", 64)
+
+# ✅ Startup: load the model and heavy libraries in a background thread right after boot,
+# and the cold `import app` budget enforced by check_startup.py
+WARMUP = env_int("PHISHSHIELD_WARMUP", 1)
+STARTUP_BUDGET_MS = env_float("PHISHSHIELD_STARTUP_BUDGET_MS", 1500)
+
+# ✅ Model registry: versions are directories under MODEL_DIR ("builtin" is the model shipped
+# with the app); /admin endpoints need the X-Admin-Token header and are off without a token.
+# MODEL_VERSION is the first version to serve; once one is activated, MODEL_DIR/ACTIVE wins,
+# and each worker checks it for changes at most once per MODEL_SYNC_SECONDS
+MODEL_DIR = env_str("PHISHSHIELD_MODEL_DIR", "model")
+MODEL_VERSION = env_str("PHISHSHIELD_MODEL_VERSION", "builtin")
+MODEL_SYNC_SECONDS = env_float("PHISHSHIELD_MODEL_SYNC_SECONDS", 1)
+ADMIN_TOKEN = env_str("PHISHSHIELD_ADMIN_TOKEN", "")
+
+# ✅ Admission control: requests in flight, requests allowed to wait, and how long they may wait
+# (seconds) before a 503; a full queue answers 429 right away. "URL" covers uncached page fetches
+ADMIT_URL_INFLIGHT = env_int("PHISHSHIELD_ADMIT_URL_INFLIGHT", 64)
+ADMIT_URL_QUEUE = env_int("PHISHSHIELD_ADMIT_URL_QUEUE", 256)
+ADMIT_URL_QUEUE_TIMEOUT = env_float("PHISHSHIELD_ADMIT_URL_QUEUE_TIMEOUT", 5)
+ADMIT_PREDICT_INFLIGHT = env_int("PHISHSHIELD_ADMIT_PREDICT_INFLIGHT", 512)
+ADMIT_PREDICT_QUEUE = env_int("PHISHSHIELD_ADMIT_PREDICT_QUEUE", 1024)
+ADMIT_PREDICT_QUEUE_TIMEOUT = env_float("PHISHSHIELD_ADMIT_PREDICT_QUEUE_TIMEOUT", 1)
+
+# ✅ Threads that parse fetched pages, kept apart from the default threadpool used by cheap calls
+EXTRACT_THREADS = env_int("PHISHSHIELD_EXTRACT_THREADS", 8)
@@ -0,0 +1,366 @@
+# filename: fetcher.py
+# Shared page fetchers: one pooled keep-alive client per process, async and blocking.
+#
+# Bodies are streamed and kept only up to FETCH_MAX_BYTES, within FETCH_BODY_DEADLINE
+# seconds, so neither huge pages nor slow-drip servers can pin memory or a worker.
+#
+# Bodies are decoded once, with no charset detection (see page_charset):
+#   byte order mark -> Content-Type charset -> <meta> charset -> FETCH_DEFAULT_CHARSET
+# Only charset labels that browsers know count (WHATWG_LABELS); others are skipped.
+#
+# Responses that are not HTML are not parsed (FetchedPage.skipped says why):
+#   content_type    Content-Type is neither HTML nor sniffable: body not downloaded
+#   content_length  declared size above FETCH_SKIP_LENGTH: body not downloaded
+#   magic_bytes     the body starts like a known binary format: download stopped there
+
+# httpx and requests are imported on first use, so importing this module stays cheap
+
+import asyncio
+import codecs
+import re
+import ssl
+import threading
+import time
+
+import config
+from metrics import record
+
+
+class FetchedPage:
+    """The parts of a response the extractor uses, with a body capped at FETCH_MAX_BYTES."""
+
+    def __init__(self, url, status_code, headers, history, content, truncated, encoding=None, skipped=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.history = history  # earlier responses in the redirect chain
+        self.content = content
+        self.truncated = truncated  # the server had more than we read (size cap or deadline)
+        self.encoding = encoding  # charset declared in the Content-Type header, if any
+        self.skipped = skipped  # why the body is not HTML to parse, or None
+
+    @property
+    def content_type(self):
+        return media_type(self.headers.get('Content-Type'))
+
+    @property
+    def text(self):
+        return decode_page(self.content, self.encoding)
+
+
+# ✅ One TLS context for every pool, so CA certificates are loaded once per process
+_ssl_context = None
+_ssl_context_lock = threading.Lock()
+
+
+def ssl_context():
+    global _ssl_context
+    if _ssl_context is None:
+        with _ssl_context_lock:
+            if _ssl_context is None:
+                _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+def build_session(pool_hosts=config.SESSION_POOL_HOSTS,
+                  pool_per_host=config.SESSION_POOL_PER_HOST):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    class SharedContextAdapter(HTTPAdapter):
+        """HTTPAdapter whose per-host connection pools all use the process TLS context."""
+
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs['ssl_context'] = ssl_context()
+            return super().init_poolmanager(*args, **kwargs)
+
+        def proxy_manager_for(self, *args, **kwargs):
+            kwargs['ssl_context'] = ssl_context()
+            return super().proxy_manager_for(*args, **kwargs)
+
+    session = requests.Session()
+    session.headers['User-Agent'] = config.FETCH_USER_AGENT
+    adapter = SharedContextAdapter(pool_connections=pool_hosts, pool_maxsize=pool_per_host)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# ✅ Charset policy: declared or default, never detected
+BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+META_CHARSET = re.compile(rb'<meta[^>]*?charset\s*=\s*["\']?\s*([a-z0-9_.:-]+)', re.I)
+META_PRESCAN_BYTES = 1024  # browsers only look this far for a <meta> charset
+# Charset labels browsers accept (the WHATWG Encoding Standard), by the codec decoding them.
+# Anything else, e.g. codecs.lookup() names like base64, rot13, utf-32 or cp500, is ignored.
+WHATWG_LABELS = {
+    'utf-8': 'unicode-1-1-utf-8 unicode11utf8 unicode20utf8 utf-8 utf8 x-unicode20utf8',
+    'cp866': '866 cp866 csibm866 ibm866',
+    'iso8859-2': 'csisolatin2 iso-8859-2 iso-ir-101 iso8859-2 iso88592 iso_8859-2 iso_8859-2:1987 l2 latin2',
+    'iso8859-3': 'csisolatin3 iso-8859-3 iso-ir-109 iso8859-3 iso88593 iso_8859-3 iso_8859-3:1988 l3 latin3',
+    'iso8859-4': 'csisolatin4 iso-8859-4 iso-ir-110 iso8859-4 iso88594 iso_8859-4 iso_8859-4:1988 l4 latin4',
+    'iso8859-5': 'csisolatincyrillic cyrillic iso-8859-5 iso-ir-144 iso8859-5 iso88595 iso_8859-5 iso_8859-5:1988',
+    'iso8859-6': 'arabic asmo-708 csiso88596e csiso88596i csisolatinarabic ecma-114 iso-8859-6 iso-8859-6-e '
+                 'iso-8859-6-i iso-ir-127 iso8859-6 iso88596 iso_8859-6 iso_8859-6:1987',
+    'iso8859-7': 'csisolatingreek ecma-118 elot_928 greek greek8 iso-8859-7 iso-ir-126 iso8859-7 iso88597 '
+                 'iso_8859-7 iso_8859-7:1987 sun_eu_greek',
+    'iso8859-8': 'csiso88598e csisolatinhebrew hebrew iso-8859-8 iso-8859-8-e iso-ir-138 iso8859-8 iso88598 '
+                 'iso_8859-8 iso_8859-8:1988 visual csiso88598i iso-8859-8-i logical',
+    'iso8859-10': 'csisolatin6 iso-8859-10 iso-ir-157 iso8859-10 iso885910 l6 latin6',
+    'iso8859-13': 'iso-8859-13 iso8859-13 iso885913',
+    'iso8859-14': 'iso-8859-14 iso8859-14 iso885914',
+    'iso8859-15': 'csisolatin9 iso-8859-15 iso8859-15 iso885915 iso_8859-15 l9',
+    'iso8859-16': 'iso-8859-16',
+    'koi8-r': 'cskoi8r koi koi8 koi8-r koi8_r',
+    'koi8-u': 'koi8-ru koi8-u',
+    'mac-roman': 'csmacintosh mac macintosh x-mac-roman',
+    'mac-cyrillic': 'x-mac-cyrillic x-mac-ukrainian',
+    'cp874': 'dos-874 iso-8859-11 iso8859-11 iso885911 tis-620 windows-874',
+    'cp1250': 'cp1250 windows-1250 x-cp1250',
+    'cp1251': 'cp1251 windows-1251 x-cp1251',
+    # Latin-1 and ASCII labels decode as windows-1252 (a superset), so bytes 0x80-0x9f stay readable
+    'cp1252': 'ansi_x3.4-1968 ascii cp1252 cp819 csisolatin1 ibm819 iso-8859-1 iso-ir-100 iso8859-1 iso88591 '
+              'iso_8859-1 iso_8859-1:1987 l1 latin1 us-ascii windows-1252 x-cp1252',
+    'cp1253': 'cp1253 windows-1253 x-cp1253',
+    'cp1254': 'cp1254 csisolatin5 iso-8859-9 iso-ir-148 iso8859-9 iso88599 iso_8859-9 iso_8859-9:1989 l5 '
+              'latin5 windows-1254 x-cp1254',
+    'cp1255': 'cp1255 windows-1255 x-cp1255',
+    'cp1256': 'cp1256 windows-1256 x-cp1256',
+    'cp1257': 'cp1257 windows-1257 x-cp1257',
+    'cp1258': 'cp1258 windows-1258 x-cp1258',
+    'gb18030': 'chinese csgb2312 csiso58gb231280 gb2312 gb_2312 gb_2312-80 gbk iso-ir-58 x-gbk gb18030',
+    'big5hkscs': 'big5 big5-hkscs cn-big5 csbig5 x-x-big5',
+    'euc_jp': 'cseucpkdfmtjapanese euc-jp x-euc-jp',
+    'iso2022_jp': 'csiso2022jp iso-2022-jp',
+    'cp932': 'csshiftjis ms932 ms_kanji shift-jis shift_jis sjis windows-31j x-sjis',
+    'cp949': 'cseuckr csksc56011987 euc-kr iso-ir-149 korean ks_c_5601-1987 ks_c_5601-1989 ksc5601 ksc_5601 '
+             'windows-949',
+    'utf-16-be': 'unicodefffe utf-16be',
+    'utf-16-le': 'csunicode iso-10646-ucs-2 ucs-2 unicode unicodefeff utf-16 utf-16le',
+}
+LABEL_CODECS = {label: codec for codec, labels in WHATWG_LABELS.items() for label in labels.split()}
+
+
+def header_charset(content_type):
+    for param in (content_type or '').split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset':
+            return value.strip().strip('"\'') or None
+    return None
+
+
+def known_codec(label):
+    return LABEL_CODECS.get(label.strip().lower()) if isinstance(label, str) else None
+
+
+def meta_codec(label):
+    # An ASCII-compatible <meta> cannot really be UTF-16, so browsers read such pages as UTF-8
+    codec = known_codec(label)
+    return 'utf-8' if codec in ('utf-16-le', 'utf-16-be') else codec
+
+
+def page_charset(content, declared=None):
+    """Codec for a page body: byte order mark, then the declared charset, then <meta>, then the default."""
+    for bom, name in BOMS:
+        if content.startswith(bom):
+            return name
+    if declared and known_codec(declared):
+        return known_codec(declared)
+    match = META_CHARSET.search(content, 0, META_PRESCAN_BYTES)
+    if match and meta_codec(match.group(1).decode('ascii')):
+        return meta_codec(match.group(1).decode('ascii'))
+    return config.FETCH_DEFAULT_CHARSET
+
+
+def decode_page(content, declared=None):
+    # One C-level decode; undecodable bytes become U+FFFD instead of failing the page
+    return content.decode(page_charset(content, declared), errors='replace')
+
+
+# ✅ Content gate: only HTML (or what might be HTML) is downloaded and parsed
+# Served as HTML, or too vague to tell: these are let through and sniffed
+SNIFFED_TYPES = {'', 'text/html', 'application/xhtml+xml', 'text/plain', 'application/octet-stream'}
+BINARY_SIGNATURES = (
+    b'%PDF-', b'PK\x03\x04', b'MZ', b'\x7fELF', b'\xca\xfe\xba\xbe', b'\xcf\xfa\xed\xfe', b'\x00asm',
+    b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a', b'\xff\xd8\xff', b'RIFF', b'OggS', b'ID3',
+    b'\x1f\x8b', b'Rar!\x1a\x07', b'7z\xbc\xaf\x27\x1c', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',
+)
+SNIFF_BYTES = 16  # enough for every signature above
+
+
+def media_type(content_type):
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+def gate_headers(headers, skip_length=config.FETCH_SKIP_LENGTH):
+    """Why the body should not be downloaded at all, judging by the headers, or None."""
+    if media_type(headers.get('Content-Type')) not in SNIFFED_TYPES:
+        return 'content_type'
+    length = headers.get('Content-Length', '')
+    if length.isdigit() and int(length) > skip_length:
+        return 'content_length'
+    return None
+
+
+class PageBody:
+    """Collects a streamed body: at most max_bytes, and nothing past a binary signature."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.chunks = []
+        self.size = 0
+        self.truncated = False
+        self.skipped = None
+
+    def add(self, chunk):
+        """Keep a chunk; True once the rest of the body is not wanted."""
+        sniffed = self.size >= SNIFF_BYTES
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if not sniffed and self.size >= SNIFF_BYTES and self.sniff():
+            return True
+        if self.size > self.max_bytes:
+            # One chunk past the cap; the rest is never downloaded
+            self.truncated = True
+            return True
+        return False
+
+    def sniff(self):
+        if b''.join(self.chunks)[:SNIFF_BYTES].startswith(BINARY_SIGNATURES):
+            self.skipped = 'magic_bytes'
+        return self.skipped
+
+    def content(self):
+        if self.size < SNIFF_BYTES:
+            self.sniff()  # short bodies never reached the check in add()
+        return b'' if self.skipped else b''.join(self.chunks)[:self.max_bytes]
+
+
+def fetch_page(session, url, timeout, max_bytes=config.FETCH_MAX_BYTES,
+               deadline=config.FETCH_BODY_DEADLINE):
+    """Blocking counterpart of AsyncPageFetcher.fetch, for a requests session."""
+    response = session.get(url, timeout=timeout, stream=True)
+    body = PageBody(max_bytes)
+    body.skipped = gate_headers(response.headers)
+    give_up_at = time.monotonic() + deadline
+    try:
+        # read1 returns whatever has arrived, so a trickling body cannot hold a read past the deadline
+        while not body.skipped and (chunk := response.raw.read1(64 * 1024, decode_content=True)):
+            if body.add(chunk):
+                break
+            if time.monotonic() > give_up_at:
+                body.truncated = True
+                break
+    finally:
+        response.close()
+    return FetchedPage(response.url, response.status_code, response.headers, response.history,
+                       body.content(), body.truncated, header_charset(response.headers.get('Content-Type')),
+                       body.skipped)
+
+
+def get_session():
+    """Process-wide keep-alive session for blocking fetches."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+# httpcore trace events (connection.connect_tcp.started, http11.receive_response_body.complete, ...)
+# mapped to stage names; DNS resolution happens inside connect_tcp
+TRACE_STAGES = {
+    'connect_tcp': 'connect',
+    'start_tls': 'tls',
+    'receive_response_headers': 'wait',
+    'receive_response_body': 'download',
+}
+
+
+class FetchTrace:
+    """httpx "trace" extension that records connect/TLS/wait/download times for one fetch."""
+
+    def __init__(self):
+        self._started = {}
+
+    async def __call__(self, event, info):
+        _, name, phase = event.rsplit('.', 2)
+        stage = TRACE_STAGES.get(name)
+        if stage is None:
+            return
+        if phase == 'started':
+            self._started[name] = time.perf_counter()
+        elif name in self._started:
+            record(stage, time.perf_counter() - self._started.pop(name))
+
+
+class AsyncPageFetcher:
+    """One pooled keep-alive HTTP client per process, with a cap on in-flight fetches."""
+
+    def __init__(self, timeout=config.FETCH_TIMEOUT,
+                 max_concurrency=config.FETCH_MAX_CONCURRENCY,
+                 max_connections=config.FETCH_MAX_CONNECTIONS,
+                 max_keepalive=config.FETCH_MAX_KEEPALIVE,
+                 keepalive_expiry=config.FETCH_KEEPALIVE_EXPIRY):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self._client = None
+        self._semaphore = None
+
+    def _ensure_client(self):
+        # Created lazily so the client binds to the running event loop
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                headers={'User-Agent': config.FETCH_USER_AGENT},
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                follow_redirects=True,
+                verify=ssl_context(),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def fetch(self, url, max_bytes=config.FETCH_MAX_BYTES, deadline=config.FETCH_BODY_DEADLINE):
+        client = self._ensure_client()
+        async with self._semaphore:
+            # Redirects reuse the request's extensions, so every hop is traced
+            async with client.stream('GET', url, extensions={'trace': FetchTrace()}) as response:
+                body = PageBody(max_bytes)
+                body.skipped = gate_headers(response.headers)
+
+                async def read_body():
+                    async for chunk in response.aiter_bytes():
+                        if body.add(chunk):
+                            return
+
+                if not body.skipped:
+                    try:
+                        await asyncio.wait_for(read_body(), deadline)
+                    except asyncio.TimeoutError:
+                        # Slow-drip server: keep what arrived in time and score that
+                        body.truncated = True
+
+            return FetchedPage(str(response.url), response.status_code, response.headers, response.history,
+                               body.content(), body.truncated, response.charset_encoding, body.skipped)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+
+# ✅ Process-wide instance shared by every request
+page_fetcher = AsyncPageFetcher()
@@ -0,0 +1,109 @@
+# filename: html_features.py
+# Single-pass collection of every tag-derived page feature.
+
+import re
+from urllib.parse import urljoin, urlparse
+
+ICON_RE = re.compile('icon', re.I)
+REF_TAGS = ('a', 'link', 'script', 'img')
+SELF_REF, EXTERNAL_REF, OTHER_REF = 'self', 'external', 'other'
+
+
+def attr_values(value):
+    # bs4 returns multi-valued attributes such as rel as a list; other parsers give the raw string
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return value.split()
+    return list(value)
+
+
+def attr_matches(value, wanted):
+    # Same rule bs4 uses for find_all(attrs=...): any single value, or the joined string
+    values = attr_values(value)
+    return wanted in values or ' '.join(values) == wanted
+
+
+def classify_ref(base_url, url):
+    try:
+        full = urljoin(base_url, url)
+        external = urlparse(full).netloc
+    except ValueError:
+        # One malformed link (e.g. a broken IPv6 host) should not fail the whole page
+        return OTHER_REF
+    if full.startswith(base_url):
+        return SELF_REF
+    return EXTERNAL_REF if external else OTHER_REF
+
+
+class TagFeatures:
+    """Counts, flags and link classification gathered in one walk over the document."""
+
+    def __init__(self):
+        self.images = 0
+        self.scripts = 0
+        self.stylesheets = 0
+        self.self_refs = 0
+        self.external_refs = 0
+        self.title = None
+        self.description = None
+        self.submit_button = False
+        self.favicon = False
+        self.iframe = False
+
+    @property
+    def has_title(self):
+        return 1 if self.title and self.title.strip() else 0
+
+    @property
+    def has_description(self):
+        return 1 if self.description and self.description.strip() else 0
+
+
+def scan_tags(document, parsed_url=None):
+    features = TagFeatures()
+    if document is None:
+        return features
+    base_url = f"{parsed_url.scheme}://{parsed_url.netloc}" if parsed_url else None
+    ref_kinds = {}  # pages repeat the same links, so resolve each distinct one once
+
+    seen_title = seen_description = False
+    for name, attrs in document.iter_tags():
+        if name == 'img':
+            features.images += 1
+        elif name == 'script':
+            features.scripts += 1
+        elif name == 'link':
+            rel = attrs.get('rel')
+            if attr_matches(rel, 'stylesheet'):
+                features.stylesheets += 1
+            if not features.favicon and ICON_RE.search(' '.join(attr_values(rel))):
+                features.favicon = True
+        elif name == 'title':
+            seen_title = True
+        elif name == 'meta':
+            if not seen_description and attrs.get('name') == 'description':
+                seen_description = True
+                features.description = attrs.get('content', '')
+        elif name == 'input':
+            if attrs.get('type') == 'submit':
+                features.submit_button = True
+        elif name == 'button':
+            features.submit_button = True
+        elif name == 'iframe':
+            features.iframe = True
+
+        if base_url is not None and name in REF_TAGS:
+            url = attrs.get('href') or attrs.get('src')
+            if url:
+                kind = ref_kinds.get(url)
+                if kind is None:
+                    kind = ref_kinds[url] = classify_ref(base_url, url)
+                if kind == SELF_REF:
+                    features.self_refs += 1
+                elif kind == EXTERNAL_REF:
+                    features.external_refs += 1
+
+    if seen_title:
+        features.title = document.title_string()
+    return features
@@ -0,0 +1,180 @@
+# filename: html_parsers.py
+# Interchangeable HTML parser backends behind one small document interface.
+#
+# Every backend exposes the same four operations the feature code needs:
+#   iter_tags()     -> (name, attrs) for every element, in document order
+#   title_string()  -> the first <title>'s string, with BeautifulSoup's .string rules
+#   text()          -> visible text, like BeautifulSoup.get_text() (no script/style/template)
+#   markup()        -> all markup text (tag and attribute names and values, text, comments)
+# Parsers are imported on first use, so only the configured one has to be installed.
+# Where the HTML5 parsers (lxml, lexbor) differ from html.parser is listed, with the
+# reason, in parser_parity.KNOWN_DRIFT and checked against the pages in parity_pages/.
+
+import config
+
+HIDDEN_TEXT_TAGS = ('script', 'style', 'template')
+
+
+class SoupDocument:
+    """BeautifulSoup tree (the original behaviour, with Python's html.parser by default)."""
+
+    def __init__(self, content, features='html.parser'):
+        from bs4 import BeautifulSoup
+        # A repeated attribute keeps its first value, as in browsers and the HTML5 backends
+        # (html.parser alone would keep the last, e.g. the second href of <a href href>)
+        options = {'on_duplicate_attribute': 'ignore'} if features == 'html.parser' else {}
+        self.soup = BeautifulSoup(content, features, **options)
+
+    def iter_tags(self):
+        from bs4 import Tag
+        for element in self.soup.descendants:
+            if isinstance(element, Tag):
+                yield element.name, element.attrs
+
+    def title_string(self):
+        title = self.soup.title
+        return title.string if title else None
+
+    def text(self):
+        return self.soup.get_text()
+
+    def markup(self):
+        return self.soup.decode()
+
+
+class LxmlDocument:
+    """libxml2 HTML parser through lxml, consumed as a stream of parse events (no tree)."""
+
+    def __init__(self, content):
+        from lxml import etree
+        self.tags = []
+        self._text = []
+        self._markup = []
+        self._open = []
+        self._title = None      # children of the first <title>, captured as nested lists
+        self._title_stack = None
+        parser = etree.HTMLParser(target=self, recover=True)
+        parser.feed(content)
+        parser.close()
+
+    # lxml parser target callbacks
+    def start(self, tag, attrib):
+        attrs = dict(attrib)
+        self.tags.append((tag, attrs))
+        self._open.append(tag)
+        self._markup.append(tag)
+        for name, value in attrs.items():
+            self._markup.append(name)
+            self._markup.append(value)
+        if self._title_stack is not None:
+            element = []
+            self._title_stack[-1].append(element)
+            self._title_stack.append(element)
+        elif tag == 'title' and self._title is None:
+            self._title = []
+            self._title_stack = [self._title]
+
+    def end(self, tag):
+        if self._open:
+            self._open.pop()
+        if self._title_stack is not None:
+            self._title_stack.pop()
+            if not self._title_stack:
+                self._title_stack = None
+
+    def data(self, data):
+        self._markup.append(data)
+        if not self._open or self._open[-1] not in HIDDEN_TEXT_TAGS:
+            self._text.append(data)
+        if self._title_stack is not None:
+            children = self._title_stack[-1]
+            # Adjacent chunks belong to one text node
+            if children and isinstance(children[-1], str):
+                children[-1] += data
+            else:
+                children.append(data)
+
+    def comment(self, text):
+        self._markup.append(text)
+
+    def close(self):
+        return None
+
+    def iter_tags(self):
+        return iter(self.tags)
+
+    def title_string(self):
+        return self._string(self._title) if self._title is not None else None
+
+    def _string(self, children):
+        if len(children) != 1:
+            return None
+        child = children[0]
+        return child if isinstance(child, str) else self._string(child)
+
+    def text(self):
+        return ''.join(self._text)
+
+    def markup(self):
+        # Pieces are kept apart so a search cannot match across two of them
+        return '\n'.join(self._markup)
+
+
+class LexborDocument:
+    """HTML5-compliant C parser (lexbor, via selectolax)."""
+
+    def __init__(self, content):
+        from selectolax.lexbor import LexborHTMLParser
+        self.tree = LexborHTMLParser(content)
+
+    def iter_tags(self):
+        root = self.tree.root
+        if root is None:
+            return
+        for node in root.traverse(include_text=False):
+            if node.is_element_node:
+                # Valueless attributes come back as None; bs4 reports them as ''
+                attrs = {k: ('' if v is None else v) for k, v in node.attributes.items()}
+                yield node.tag, attrs
+
+    def title_string(self):
+        title = self.tree.css_first('title')
+        return self._string(title) if title is not None else None
+
+    def _string(self, node):
+        children = list(node.iter(include_text=True))
+        if len(children) != 1:
+            return None
+        child = children[0]
+        if child.is_text_node:
+            return child.text_content
+        return self._string(child) if child.is_element_node else None
+
+    def text(self):
+        root = self.tree.root
+        if root is None:
+            return ''
+        parts = []
+        for node in root.traverse(include_text=True):
+            if node.is_text_node and node.parent.tag not in HIDDEN_TEXT_TAGS:
+                parts.append(node.text_content)
+        return ''.join(parts)
+
+    def markup(self):
+        return self.tree.html or ''
+
+
+PARSER_BACKENDS = {
+    'html.parser': lambda content: SoupDocument(content, 'html.parser'),
+    'lxml': LxmlDocument,
+    'lexbor': LexborDocument,
+}
+
+
+def parse_html(content, backend=None):
+    backend = backend or config.PARSER_BACKEND
+    try:
+        factory = PARSER_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown HTML parser backend: {backend!r} (choose from {', '.join(PARSER_BACKENDS)})")
+    return factory(content)
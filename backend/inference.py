@@ -0,0 +1,109 @@
+# filename: inference.py
+# Interchangeable scoring engines for the full 22-feature model.
+#
+#   xgboost - xgb.Booster with in-place prediction and a pinned thread count (.ubj)
+#   numpy   - tree_ensemble.TreeEnsemble, no xgboost import, lowest single-row latency (.npz)
+#
+# Both take a (n_rows, n_features) matrix in FEATURE_COLUMNS order. predict() returns the
+# probability of the positive (Legitimate) class for each row; predict_labels() returns
+# the labels int(round(p)) and how many trees were evaluated for each row.
+
+import threading
+
+import numpy as np
+
+from tree_ensemble import TreeEnsemble
+
+
+class FeatureBuffer:
+    """Packs feature dicts into a reused float32 matrix, one buffer per thread."""
+
+    def __init__(self, feature_columns, initial_rows=64):
+        self.feature_columns = list(feature_columns)
+        self.initial_rows = initial_rows
+        self._local = threading.local()
+
+    def _buffer(self, n_rows):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or len(buffer) < n_rows:
+            size = max(n_rows, self.initial_rows, 2 * len(buffer) if buffer is not None else 0)
+            buffer = np.empty((size, len(self.feature_columns)), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer
+
+    def pack(self, rows):
+        """Matrix view in column order; valid until this thread packs again.
+
+        Missing features become NaN (treated as missing by the model), extra keys are ignored.
+        """
+        matrix = self._buffer(len(rows))[:len(rows)]
+        columns = self.feature_columns
+        nan = np.nan
+        for i, row in enumerate(rows):
+            matrix[i] = [row.get(name, nan) for name in columns]
+        return matrix
+
+
+def check_feature_order(model_features, feature_columns):
+    if model_features and list(model_features) != list(feature_columns):
+        raise ValueError(f"Model features {list(model_features)} do not match {list(feature_columns)}")
+
+
+class XGBoostEngine:
+    name = "xgboost"
+    artifact = ".ubj"
+
+    def __init__(self, path, feature_columns, nthread=1, early_exit_chunk=0):
+        import xgboost as xgb  # only needed when this engine is selected
+        self.booster = xgb.Booster()
+        self.booster.load_model(path)
+        check_feature_order(self.booster.feature_names, feature_columns)
+        # Every server thread may predict at once; a per-call thread pool on top of that
+        # oversubscribes the cores, so each call gets a fixed, small number of threads
+        self.nthread = nthread
+        self.booster.set_param({"nthread": nthread})
+
+    def predict(self, matrix):
+        # Columns were checked against the model at load time, so the plain array goes in
+        # as-is with no DMatrix or feature-name handling per call
+        return self.booster.inplace_predict(np.asarray(matrix, dtype=np.float32), validate_features=False)
+
+    def predict_labels(self, matrix):
+        # xgboost always sums every tree
+        labels = np.round(self.predict(matrix)).astype(np.int64)
+        return labels, np.full(len(labels), self.booster.num_boosted_rounds(), dtype=np.int32)
+
+
+class NumpyEngine:
+    name = "numpy"
+    artifact = ".npz"
+
+    def __init__(self, path, feature_columns, nthread=1, early_exit_chunk=0):
+        # Single-threaded by construction; nthread is accepted for a uniform signature
+        self.ensemble = TreeEnsemble.load(path)
+        check_feature_order(self.ensemble.feature_names, feature_columns)
+        self.early_exit_chunk = early_exit_chunk
+
+    def predict(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if len(matrix) == 1:
+            return np.array([self.ensemble.predict_row(matrix[0])])
+        return self.ensemble.predict(matrix)
+
+    def predict_labels(self, matrix):
+        if self.early_exit_chunk > 0:
+            return self.ensemble.predict_labels(matrix, self.early_exit_chunk)
+        labels = np.round(self.predict(matrix)).astype(np.int64)
+        return labels, np.full(len(labels), self.ensemble.n_trees, dtype=np.int32)
+
+
+ENGINES = {engine.name: engine for engine in (XGBoostEngine, NumpyEngine)}
+
+
+def load_engine(name, model_stem, feature_columns, nthread=1, early_exit_chunk=0):
+    """Load the engine from its own compiled artifact, model_stem + .ubj or .npz."""
+    try:
+        engine = ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown inference engine {name!r}; expected one of {sorted(ENGINES)}")
+    return engine(model_stem + engine.artifact, feature_columns, nthread=nthread, early_exit_chunk=early_exit_chunk)
@@ -0,0 +1,130 @@
+# filename: lexical_model.py
+# URL-only scorer derived from the full booster, for verdicts without any page fetch.
+#
+# There is no separately trained URL-only model. Instead every tree of the full model is
+# evaluated with the page-derived features unknown: a split on a page feature sends the row
+# down both branches, weighted by how much training data went each way (the node cover,
+# "sum_hessian" in the XGBoost JSON dump). The result is the full model's expected margin
+# given only the URL.
+#
+# Flattened, each leaf becomes a box over the URL features (the lexical splits on its path)
+# with a constant (its value times the branch weights of the page splits on its path), so
+# scoring is a vectorized "which boxes contain this row" test over all leaves.
+
+import json
+import math
+import numpy as np
+
+from tree_ensemble import base_margin
+
+LEXICAL_COLUMNS = [
+    "URLLength", "DomainLength", "TLDLength", "IsHTTPS", "Abnormal_URL", "LetterToDigitRatio"
+]
+
+
+def lexical_leaves(tree, lexical_index):
+    """Yield (lower, upper, weighted value) for every leaf reachable in one tree."""
+    left = tree['left_children']
+    right = tree['right_children']
+    split_index = tree['split_indices']
+    condition = tree['split_conditions']
+    cover = tree['sum_hessian']
+    n_lexical = len(lexical_index)
+
+    stack = [(0, 1.0, [-np.inf] * n_lexical, [np.inf] * n_lexical)]
+    while stack:
+        node, weight, lower, upper = stack.pop()
+        l, r = left[node], right[node]
+        if l == -1:
+            yield lower, upper, weight * condition[node]
+            continue
+        feature = lexical_index.get(split_index[node])
+        threshold = np.float32(condition[node])
+        if feature is None:
+            share = cover[l] / (cover[l] + cover[r])
+            stack.append((l, weight * share, lower, upper))
+            stack.append((r, weight * (1 - share), lower, upper))
+        else:
+            # XGBoost goes left when x < threshold
+            if threshold > lower[feature]:
+                stack.append((l, weight, lower, upper[:feature] + [min(upper[feature], threshold)] + upper[feature + 1:]))
+            if threshold < upper[feature]:
+                stack.append((r, weight, lower[:feature] + [max(lower[feature], threshold)] + lower[feature + 1:], upper))
+
+
+class LexicalModel:
+    def __init__(self, model_json, feature_columns):
+        learner = model_json['learner']
+        index = {name: i for i, name in enumerate(feature_columns)}
+        lexical_index = {index[name]: i for i, name in enumerate(LEXICAL_COLUMNS)}
+
+        self.base_margin = base_margin(learner)
+
+        # Leaves with the same box always fire together, so their values can be summed
+        boxes = {}
+        for tree in learner['gradient_booster']['model']['trees']:
+            for lower, upper, value in lexical_leaves(tree, lexical_index):
+                key = (tuple(lower), tuple(upper))
+                boxes[key] = boxes.get(key, 0.0) + value
+        self.lower = np.array([key[0] for key in boxes], dtype=np.float32).reshape(-1, len(LEXICAL_COLUMNS))
+        self.upper = np.array([key[1] for key in boxes], dtype=np.float32).reshape(-1, len(LEXICAL_COLUMNS))
+        self.values = np.array(list(boxes.values()), dtype=np.float64)
+        self._index()
+
+    def _index(self):
+        lower, upper = self.lower, self.upper
+        # Per feature, the box bounds cut the axis into cells; precompute which boxes cover
+        # each cell so scoring is one lookup per feature plus an AND across features
+        self.cuts = []
+        self.cell_masks = []
+        for f in range(len(LEXICAL_COLUMNS)):
+            bounds = np.concatenate([lower[:, f], upper[:, f]])
+            cuts = np.unique(bounds[np.isfinite(bounds)])
+            representatives = np.concatenate([[-np.inf], cuts]).astype(np.float32)
+            masks = (lower[None, :, f] <= representatives[:, None]) & (upper[None, :, f] > representatives[:, None])
+            self.cuts.append(cuts)
+            self.cell_masks.append(masks)
+
+    def to_arrays(self):
+        """Plain arrays for np.savez, prefixed so they can share a file with the full model."""
+        return {
+            'lexical_lower': self.lower,
+            'lexical_upper': self.upper,
+            'lexical_values': self.values,
+            'lexical_base_margin': np.float64(self.base_margin),
+            'lexical_columns': np.array(LEXICAL_COLUMNS, dtype=str),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        columns = [str(name) for name in arrays['lexical_columns']]
+        if columns != LEXICAL_COLUMNS:
+            raise ValueError(f"Lexical model was compiled for {columns}, expected {LEXICAL_COLUMNS}")
+        self = cls.__new__(cls)
+        self.lower = arrays['lexical_lower']
+        self.upper = arrays['lexical_upper']
+        self.values = arrays['lexical_values']
+        self.base_margin = float(arrays['lexical_base_margin'])
+        self._index()
+        return self
+
+    @classmethod
+    def load(cls, path, feature_columns):
+        # The .npz written by compile_model.py holds the boxes already derived for
+        # LEXICAL_COLUMNS (feature_columns is only needed to derive them from JSON)
+        if path.endswith('.npz'):
+            with np.load(path) as arrays:
+                return cls.from_arrays(arrays)
+        with open(path) as f:
+            return cls(json.load(f), feature_columns)
+
+    def predict(self, features):
+        """Probability of the positive (Legitimate) class from a dict of LEXICAL_COLUMNS."""
+        # XGBoost compares features and thresholds as float32
+        row = np.array([features[name] for name in LEXICAL_COLUMNS], dtype=np.float32)
+        inside = None
+        for value, cuts, masks in zip(row, self.cuts, self.cell_masks):
+            mask = masks[np.searchsorted(cuts, value, side='right')]
+            inside = mask if inside is None else inside & mask
+        margin = self.base_margin + self.values[inside].sum()
+        return 1.0 / (1.0 + math.exp(-margin))
@@ -0,0 +1,186 @@
+# filename: metrics.py
+# Per-request stage timers (sent back as a Server-Timing header) and process-wide
+# Prometheus metrics, rendered in the text exposition format for /metrics.
+#
+#   with stage("parse"):    times a block for the current request and for the
+#                           phishshield_stage_seconds{stage="parse"} histogram
+#
+# Stages recorded in worker threads reach the request as long as the thread runs in a
+# copy of the request's context (see run_in_context).
+
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(dict(zip(self.label_names, key)))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = dict(zip(self.label_names, key))
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': bound})} {count}")
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {series[-1]}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("phishshield_request_seconds", "Request latency by route.", ("route",))
+STAGE_SECONDS = Histogram("phishshield_stage_seconds", "Time spent in each processing stage.", ("stage",))
+FETCH_ERRORS = Counter("phishshield_fetch_errors_total", "Page fetches or extractions that failed.")
+PAGES_TRUNCATED = Counter("phishshield_pages_truncated_total",
+                          "Pages scored on a partial body (size cap or body deadline).")
+PAGES_SKIPPED = Counter("phishshield_pages_skipped_total",
+                        "Responses not parsed as HTML, by reason (content_type, content_length, magic_bytes).",
+                        ("reason",))
+PREDICTIONS = Counter("phishshield_predictions_total", "Verdicts returned, by result and mode.",
+                      ("result", "mode"))
+CACHE_LOOKUPS = Counter("phishshield_cache_lookups_total", "Verdict lookups by cache layer and outcome.",
+                        ("layer", "outcome"))
+REQUESTS_COALESCED = Counter("phishshield_requests_coalesced_total",
+                             "Requests that shared another request's in-flight run instead of starting their own.",
+                             ("flight",))
+ROWS_SCORED = Counter("phishshield_rows_scored_total", "Feature rows scored by the full model.")
+TREES_EVALUATED = Counter("phishshield_trees_evaluated_total",
+                          "Trees evaluated for those rows (fewer than all of them when early exit stops a row).")
+
+METRICS = [REQUEST_SECONDS, STAGE_SECONDS, FETCH_ERRORS, PAGES_TRUNCATED, PAGES_SKIPPED, PREDICTIONS,
+           CACHE_LOOKUPS, REQUESTS_COALESCED, ROWS_SCORED, TREES_EVALUATED]
+
+
+def render(extra_lines=()):
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+# ✅ Per-request stage timings
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.stages = {}  # stage -> seconds, summed when a stage runs more than once
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def header(self):
+        with self._lock:
+            return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items())
+
+
+def record(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def run_in_context(fn, *args):
+    """Wrap fn for an executor so stages it records reach the calling request."""
+    return functools.partial(contextvars.copy_context().run, fn, *args)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware: collects the request's stages and adds a Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - start
+                header = timings.header()
+                header = f"{header}, total;dur={total * 1000:.2f}" if header else f"total;dur={total * 1000:.2f}"
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            # The matched route template keeps label values bounded (no raw paths)
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                    route=getattr(route, "path", "unmatched"))
@@ -0,0 +1,256 @@
+# filename: model_registry.py
+# Versioned compiled models with atomic, zero-downtime activation and rollback.
+#
+# A version is a directory under the registry root (model/ by default) holding the
+# artifacts written by compile_model.py:
+#   python compile_model.py --model new.json --scaler new.pkl --out model/v2/xgb_model_raw.json
+# "builtin" is the compiled model shipped next to app.py.
+#
+# Activation loads and warms the new version first, then swaps a single reference.
+# Requests that already hold the old version finish on it, and the next request gets
+# the new one.
+#
+# The active version (and the rollback history) is saved in model/ACTIVE. Every worker
+# checks that file at most once per PHISHSHIELD_MODEL_SYNC_SECONDS and follows a change
+# made by another worker, loading the new version in the background. The file also
+# decides the version a restarted worker starts on; PHISHSHIELD_MODEL_VERSION only
+# applies while it does not exist.
+
+import json
+import logging
+import os
+import threading
+import time
+
+import config
+
+ARTIFACT_NAME = "xgb_model_raw"
+BUILTIN = "builtin"
+STATE_NAME = "ACTIVE"
+
+logger = logging.getLogger(__name__)
+
+
+class ModelVersion:
+    """Everything scored with one compiled model: full engine, row packing and lexical model."""
+
+    def __init__(self, version, stem, feature_columns):
+        from inference import FeatureBuffer, load_engine
+        from lexical_model import LexicalModel
+
+        self.version = version
+        self.stem = stem
+        self.load_ms = {}
+
+        start = time.perf_counter()
+        self.engine = load_engine(config.INFERENCE_ENGINE, stem, feature_columns,
+                                  config.INFERENCE_THREADS, config.EARLY_EXIT_CHUNK)
+        self.load_ms["model"] = round((time.perf_counter() - start) * 1000, 1)
+
+        # Feature dicts are packed into per-thread float32 buffers in feature_columns order
+        self.feature_buffer = FeatureBuffer(feature_columns)
+
+        # URL-only model derived from the same booster, for lexical mode (no page fetch)
+        start = time.perf_counter()
+        self.lexical = LexicalModel.load(stem + ".npz", feature_columns)
+        self.load_ms["lexical model"] = round((time.perf_counter() - start) * 1000, 1)
+        self.loaded_at = time.time()
+
+    def warm(self):
+        from lexical_model import LEXICAL_COLUMNS
+        # One prediction through each model touches every array before real traffic does
+        self.engine.predict(self.feature_buffer.pack([{}]))
+        self.lexical.predict({name: 0 for name in LEXICAL_COLUMNS})
+
+
+class ModelRegistry:
+    def __init__(self, root, builtin_stem, feature_columns, initial=BUILTIN, on_swap=None):
+        self.root = root
+        self.builtin_stem = builtin_stem
+        self.feature_columns = feature_columns
+        self.initial = initial
+        self.on_swap = on_swap  # called with the new ModelVersion after every swap
+        self.state_path = os.path.join(root, STATE_NAME)
+        self._active = None
+        self._previous = []  # versions activated before the current one, most recent last
+        self._loaded = {}  # version -> ModelVersion, kept for the active and previous versions
+        self._lock = threading.RLock()
+        self._state_mtime = None  # of the state file as last read or written by this worker
+        self._next_check = 0.0
+        self._following = False
+
+    def stem(self, version):
+        if version == BUILTIN:
+            return self.builtin_stem
+        if version in self.available():
+            return os.path.join(self.root, version, ARTIFACT_NAME)
+        raise KeyError(f"Unknown model version: {version}")
+
+    def available(self):
+        """Versions on disk, builtin first; new directories show up without a restart."""
+        from inference import ENGINES
+        required = (".npz", ENGINES[config.INFERENCE_ENGINE].artifact)
+        found = []
+        if os.path.isdir(self.root):
+            for name in sorted(os.listdir(self.root)):
+                stem = os.path.join(self.root, name, ARTIFACT_NAME)
+                if name != BUILTIN and all(os.path.isfile(stem + suffix) for suffix in required):
+                    found.append(name)
+        return [BUILTIN] + found
+
+    @property
+    def active(self):
+        # Read without the lock: swapping the reference is atomic
+        current = self._active
+        if current is None:
+            with self._lock:
+                if self._active is None:
+                    self._start()
+                current = self._active
+        elif time.monotonic() >= self._next_check:
+            self._check_state()
+        return current
+
+    def _start(self):
+        state = self._read_state()
+        if state is not None and state["active"] != self.initial:
+            try:
+                self._active = self._load(state["active"])
+                self._previous = list(state["previous"])
+                return
+            except Exception:
+                logger.exception("Saved model version %r failed to load, starting on %r",
+                                 state["active"], self.initial)
+        self._active = self._load(self.initial)
+        if state is not None:
+            self._previous = list(state["previous"])
+
+    def _read_state(self):
+        try:
+            mtime = os.stat(self.state_path).st_mtime_ns
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.exception("Unreadable model state file %s", self.state_path)
+            return None
+        self._state_mtime = mtime
+        return state
+
+    def _write_state(self, active, previous):
+        # Written whole and renamed into place, so other workers never read half a file
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"active": active, "previous": previous}, f)
+        os.replace(tmp, self.state_path)
+        self._state_mtime = os.stat(self.state_path).st_mtime_ns
+
+    def _check_state(self):
+        # A stat per interval on the request path; loading happens in a background thread
+        self._next_check = time.monotonic() + config.MODEL_SYNC_SECONDS
+        try:
+            mtime = os.stat(self.state_path).st_mtime_ns
+        except OSError:
+            return
+        with self._lock:
+            if mtime == self._state_mtime or self._following:
+                return
+            self._following = True
+        threading.Thread(target=self._follow, name="model-sync", daemon=True).start()
+
+    def _follow(self):
+        try:
+            self._apply_state()
+        except Exception:
+            logger.exception("Could not follow the model version in %s", self.state_path)
+        finally:
+            self._following = False
+
+    def _apply_state(self):
+        """Adopt the version and rollback history saved by whichever worker wrote last."""
+        with self._lock:
+            state = self._read_state()
+            if state is None:
+                return
+            if state["active"] != self._active.version:
+                loaded = self._load(state["active"])
+                self._previous = list(state["previous"])
+                self._swap(loaded)
+                logger.info("Model version %s activated by another worker", loaded.version)
+            else:
+                self._previous = list(state["previous"])
+
+    def _swap(self, loaded):
+        self._active = loaded
+        self._evict()
+        if self.on_swap is not None:
+            self.on_swap(loaded)
+
+    def _load(self, version):
+        with self._lock:
+            loaded = self._loaded.get(version)
+            if loaded is None:
+                loaded = ModelVersion(version, self.stem(version), self.feature_columns)
+                loaded.warm()
+                self._loaded[version] = loaded
+            return loaded
+
+    def load(self, version):
+        """Load and warm a version without activating it."""
+        return self._load(version)
+
+    def activate(self, version):
+        with self._lock:
+            if self._active is None:
+                self._start()
+            self._apply_state()  # start from what other workers may have activated since
+            current = self._active
+            if version == current.version:
+                return current
+            loaded = self._load(version)
+            self._write_state(version, self._previous + [current.version])
+            self._previous.append(current.version)
+            self._swap(loaded)
+            return loaded
+
+    def rollback(self):
+        """Reactivate the version that was active before the current one."""
+        with self._lock:
+            if self._active is None:
+                self._start()
+            self._apply_state()
+            if not self._previous:
+                raise LookupError("No previous model version to roll back to")
+            version = self._previous[-1]
+            loaded = self._load(version)
+            self._write_state(version, self._previous[:-1])
+            self._previous.pop()
+            self._swap(loaded)
+            return loaded
+
+    def _evict(self):
+        # Keep the active version and the rollback target in memory, drop the rest
+        keep = {self._active.version}
+        if self._previous:
+            keep.add(self._previous[-1])
+        for version in list(self._loaded):
+            if version not in keep:
+                del self._loaded[version]
+
+    def describe(self):
+        with self._lock:
+            active = self._active.version if self._active is not None else None
+            versions = []
+            for version in self.available():
+                loaded = self._loaded.get(version)
+                versions.append({
+                    "version": version,
+                    "active": version == active,
+                    "loaded": loaded is not None,
+                    "loaded_at": loaded.loaded_at if loaded else None,
+                    "load_ms": loaded.load_ms if loaded else None,
+                })
+            return {"active": active, "rollback_to": self._previous[-1] if self._previous else None,
+                    "versions": versions}
@@ -0,0 +1,149 @@
+# filename: parser_parity.py
+# Checks that every HTML parser backend yields the same model features on saved pages.
+#
+# Usage: python parser_parity.py [PAGES_DIR] [--url URL] [--backends html.parser,lxml,lexbor]
+#
+# Each *.html / *.htm file in PAGES_DIR (parity_pages/ by default, which holds the known
+# edge cases) is scored as if it had been fetched from URL (or from the URL stored next
+# to it in a <name>.url file). Every page must yield all of the model's feature columns,
+# and every column must match the first backend, except for the drifts in KNOWN_DRIFT.
+# Exits non-zero on any other drift, and on a known drift that no longer happens.
+#
+# charset_*.html pages declare a charset label that must not change what is read from
+# ASCII markup (non-text codecs, UTF-16/32 in a <meta>, EBCDIC): they must score the
+# same as their bytes declared as UTF-8.
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from fetcher import META_CHARSET
+from html_parsers import PARSER_BACKENDS
+from url_feature_extractor import URLFeatureExtractor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PAGES_DIR = os.path.join(HERE, 'parity_pages')
+MODEL_ARRAYS = os.path.join(HERE, 'xgb_model_raw.npz')
+
+# (page, column) -> backends that differ from html.parser there, and why. lxml and lexbor
+# follow the HTML5 parsing rules; html.parser (the original behaviour) does not.
+KNOWN_DRIFT = {
+    # <title> is RCDATA: "<!--c-->x" is its text, not a comment plus text, so .string is set
+    ('title_comment.html', 'HasTitle'): {'lxml', 'lexbor'},
+    # <textarea> is RCDATA too: the markup inside it is text, not elements
+    **{('textarea_markup.html', column): {'lxml', 'lexbor'}
+       for column in ('NoOfImage', 'NoOfSelfRef', 'NoOfExternalRef', 'HasSubmitButton')},
+    # lexbor keeps <template> content in a separate fragment that tree traversal skips
+    **{('template_content.html', column): {'lexbor'}
+       for column in ('NoOfImage', 'NoOfSelfRef', 'HasSubmitButton', 'Iframe')},
+}
+
+
+def model_columns(path=MODEL_ARRAYS):
+    with np.load(path) as arrays:
+        return [str(name) for name in arrays['feature_names']]
+
+
+class SavedPage:
+    """Just enough of an HTTP response for URLFeatureExtractor."""
+
+    def __init__(self, content):
+        self.content = content  # raw bytes, decoded by the extractor's charset policy
+        self.headers = {}
+        self.status_code = 200
+        self.history = []
+
+
+def page_url(path, default_url):
+    url_file = path.with_suffix('.url')
+    if url_file.exists():
+        return url_file.read_text().strip()
+    return default_url
+
+
+def features_by_backend(path, url, backends):
+    page = SavedPage(path.read_bytes())
+    results = {}
+    for backend in backends:
+        extractor = URLFeatureExtractor(url, response=page, parser=backend)
+        results[backend] = extractor.extract_model_features()
+    return results
+
+
+def charset_drift(path, url, backend, columns):
+    """(column, as UTF-8, as declared) wherever the page's charset label changes a feature."""
+    content = path.read_bytes()
+    match = META_CHARSET.search(content)
+    if match is None:
+        return [('charset', 'a <meta> charset', None)]
+    as_utf8 = content[:match.start(1)] + b'utf-8' + content[match.end(1):]
+    declared = URLFeatureExtractor(url, response=SavedPage(content), parser=backend).extract_model_features()
+    expected = URLFeatureExtractor(url, response=SavedPage(as_utf8), parser=backend).extract_model_features()
+    return [(column, expected.get(column), declared.get(column))
+            for column in ['error', *columns] if declared.get(column) != expected.get(column)]
+
+
+def compare(results, reference, columns):
+    drift = []
+    expected = results[reference]
+    for backend, features in results.items():
+        if 'error' in features:
+            drift.append((backend, 'error', None, features['error']))
+            continue
+        for column in columns:
+            if features.get(column) != expected.get(column):
+                drift.append((backend, column, expected.get(column), features.get(column)))
+    return drift
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every HTML parser backend yields the same features.")
+    parser.add_argument('pages_dir', nargs='?', default=PAGES_DIR)
+    parser.add_argument('--url', default='https://example.com/')
+    parser.add_argument('--backends', default=','.join(PARSER_BACKENDS))
+    args = parser.parse_args(argv)
+
+    backends = args.backends.split(',')
+    columns = model_columns()
+    pages = sorted(p for p in Path(args.pages_dir).iterdir() if p.suffix in ('.html', '.htm'))
+    failures = known = 0
+    seen = set()
+    for path in pages:
+        results = features_by_backend(path, page_url(path, args.url), backends)
+        for name, features in results.items():
+            missing = [column for column in columns if column not in features and 'error' not in features]
+            if missing:
+                failures += 1
+                print(f"{path.name}: {name} is missing {', '.join(missing)}")
+        for backend, column, expected, actual in compare(results, backends[0], columns):
+            allowed = backends[0] == 'html.parser' and backend in KNOWN_DRIFT.get((path.name, column), ())
+            if allowed:
+                known += 1
+                seen.add((path.name, column, backend))
+            else:
+                failures += 1
+            print(f"{path.name}: {column} {backends[0]}={expected!r} {backend}={actual!r}"
+                  f"{' (known)' if allowed else ''}")
+        if path.name.startswith('charset_'):
+            for column, expected, actual in charset_drift(path, page_url(path, args.url), backends[0], columns):
+                failures += 1
+                print(f"{path.name}: {column} as utf-8={expected!r} as declared={actual!r}")
+
+    # A known drift that went away means the parser changed; KNOWN_DRIFT should say so
+    names = {path.name for path in pages}
+    for (page, column), drifting in KNOWN_DRIFT.items():
+        for backend in drifting & set(backends[1:]):
+            if page in names and backends[0] == 'html.parser' and (page, column, backend) not in seen:
+                failures += 1
+                print(f"{page}: {column} no longer drifts on {backend}; update KNOWN_DRIFT")
+
+    print(f"{len(pages)} pages, {len(backends)} backends, {len(columns)} columns, "
+          f"{known} known drifts, {failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
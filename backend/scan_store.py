@@ -0,0 +1,110 @@
+# filename: scan_store.py
+# Durable URL -> (features, prediction, fetched_at) cache shared by every worker on a node.
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    url TEXT PRIMARY KEY,
+    features TEXT NOT NULL,
+    prediction INTEGER NOT NULL,
+    fetched_at REAL NOT NULL
+)
+"""
+
+
+class ScanStore:
+    """SQLite in WAL mode: many readers and one writer at a time across processes."""
+
+    def __init__(self, path=config.SCAN_DB_PATH, ttl=config.SCAN_DB_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()  # guards the counters, updated from threadpool threads
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=config.SCAN_DB_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get(self, url):
+        if not self.enabled:
+            return None
+        try:
+            row = self._connection().execute(
+                "SELECT features, prediction, fetched_at FROM scans WHERE url = ? AND fetched_at >= ?",
+                (url, time.time() - self.ttl),
+            ).fetchone()
+        except sqlite3.Error as e:
+            # The store is only an optimization: a broken database means a cache miss
+            with self._lock:
+                self.errors += 1
+            logger.warning("scan store read failed: %s", e)
+            return None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        features, prediction, fetched_at = row
+        return {"features": json.loads(features), "prediction": prediction, "fetched_at": fetched_at}
+
+    def put(self, url, features, prediction, fetched_at=None):
+        if not self.enabled:
+            return
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO scans (url, features, prediction, fetched_at) VALUES (?, ?, ?, ?)",
+                (url, json.dumps(features), int(prediction), fetched_at or time.time()),
+            )
+        except sqlite3.Error as e:
+            with self._lock:
+                self.errors += 1
+            logger.warning("scan store write failed: %s", e)
+
+    def compact(self):
+        """Delete entries older than the TTL; returns how many were removed."""
+        if not self.enabled:
+            return 0
+        try:
+            cursor = self._connection().execute(
+                "DELETE FROM scans WHERE fetched_at < ?", (time.time() - self.ttl,)
+            )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            with self._lock:
+                self.errors += 1
+            logger.warning("scan store compaction failed: %s", e)
+            return 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+            }
@@ -0,0 +1,47 @@
+# filename: single_flight.py
+# Request coalescing: concurrent calls for the same key share one in-flight run.
+#
+#   first caller     starts the work as its own task (the leader)
+#   later callers    await that same task while it runs (merged) and get its result,
+#                    or its exception
+#
+# The work runs as a separate task, so a leader whose client disconnects does not
+# cancel it for the callers merged into it. Merged callers show the wait as a
+# "coalesced" stage in their Server-Timing header.
+
+import asyncio
+
+from metrics import REQUESTS_COALESCED, stage
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._inflight = {}  # key -> task
+        self.leaders = 0
+        self.merged = 0
+
+    async def run(self, key, work):
+        """Result of work() for key, started only if no run for key is in flight."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.merged += 1
+            REQUESTS_COALESCED.inc(flight=self.name)
+            with stage("coalesced"):
+                return await asyncio.shield(task)
+
+        self.leaders += 1
+        # The task copies this request's context, so the leader's stages are timed as usual
+        task = asyncio.ensure_future(work())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here too, in case every caller went away
+
+    def stats(self):
+        return {"inflight": len(self._inflight), "leaders": self.leaders, "merged": self.merged}
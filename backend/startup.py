@@ -0,0 +1,42 @@
+# filename: startup.py
+# Per-phase boot timing: each mark() records the time since the previous mark, and
+# timed() measures phases that run outside that sequence, such as the background warmup.
+#
+# Imported first by app.py, so the first phase covers the app's own imports. The
+# interpreter start before that is not included.
+
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_started = _last = time.perf_counter()
+phases = {}  # phase name -> milliseconds
+
+
+def mark(name):
+    global _last
+    now = time.perf_counter()
+    phases[name] = round((now - _last) * 1000, 1)
+    _last = now
+
+
+@contextmanager
+def timed(name):
+    """Time a phase that runs on its own (e.g. in the warmup thread), outside the mark() sequence."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def report():
+    return {"phases_ms": dict(phases), "total_ms": round((_last - _started) * 1000, 1)}
+
+
+def log_report():
+    summary = report()
+    logger.info("startup took %.0f ms: %s", summary["total_ms"],
+                ", ".join(f"{name} {ms:.0f} ms" for name, ms in summary["phases_ms"].items()))
@@ -0,0 +1,230 @@
+# filename: tree_ensemble.py
+# Pure-NumPy evaluator for the XGBoost binary:logistic tree ensemble (no xgboost import).
+#
+# Usage: python tree_ensemble.py [xgb_model_raw.json]
+#   compares predictions against xgboost on random rows (needs xgboost installed), and
+#   early-exit labels against the full ensemble
+#
+# Serving loads the same arrays from xgb_model_raw.npz (written by compile_model.py),
+# which skips parsing the JSON dump.
+#
+# All trees are flattened into one set of node arrays. Leaves point to themselves, so a
+# batch is evaluated level by level: every (row, tree) cursor steps one node down per
+# iteration, max_depth times, with no per-tree or per-row Python loop.
+
+import json
+import math
+import sys
+import numpy as np
+
+DECISION_SLACK = 1e-6  # margin distance from zero below which early exit waits for every tree
+NODE_ARRAYS = ('feature', 'threshold', 'left', 'right', 'default_left', 'value', 'roots')
+
+
+def base_margin(learner):
+    """Margin of the model's base_score: "5.293014E-1" before xgboost 3, "[5.293014E-1]" since."""
+    base_score = learner['learner_model_param']['base_score'].strip()
+    if base_score.startswith('['):
+        values = [value for value in base_score.strip('[]').split(',') if value.strip()]
+        if len(values) != 1:
+            raise ValueError(f"Expected one base_score for binary:logistic, got {base_score}")
+        base_score = values[0]
+    base_score = float(base_score)
+    return math.log(base_score / (1 - base_score))
+
+
+class TreeEnsemble:
+    def __init__(self, model_json):
+        learner = model_json['learner']
+        if learner['objective']['name'] != 'binary:logistic':
+            raise ValueError(f"Unsupported objective: {learner['objective']['name']}")
+        self.feature_names = learner.get('feature_names') or None
+
+        self.base_margin = base_margin(learner)
+
+        trees = learner['gradient_booster']['model']['trees']
+        features, thresholds, lefts, rights, default_lefts, values, roots = [], [], [], [], [], [], []
+        depth = 0
+        offset = 0
+        for tree in trees:
+            left = np.asarray(tree['left_children'], dtype=np.int32)
+            right = np.asarray(tree['right_children'], dtype=np.int32)
+            condition = np.asarray(tree['split_conditions'], dtype=np.float32)
+            is_leaf = left == -1
+            ids = np.arange(len(left), dtype=np.int32)
+
+            roots.append(offset)
+            features.append(np.where(is_leaf, 0, tree['split_indices']).astype(np.int32))
+            thresholds.append(np.where(is_leaf, 0, condition).astype(np.float32))
+            lefts.append(np.where(is_leaf, ids, left) + offset)
+            rights.append(np.where(is_leaf, ids, right) + offset)
+            default_lefts.append(np.asarray(tree['default_left'], dtype=bool))
+            values.append(np.where(is_leaf, condition, 0).astype(np.float32))
+            depth = max(depth, self._depth(left, right))
+            offset += len(left)
+
+        self.feature = np.concatenate(features)
+        self.threshold = np.concatenate(thresholds)
+        self.left = np.concatenate(lefts).astype(np.int32)
+        self.right = np.concatenate(rights).astype(np.int32)
+        self.default_left = np.concatenate(default_lefts)
+        self.value = np.concatenate(values)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.depth = depth
+        self._link()
+
+    def _link(self):
+        # children[2 * node + go_left] is the next node, so one take() replaces a where()
+        self.children = np.stack([self.right, self.left], axis=1).ravel()
+
+        # Smallest and largest leaf of each tree, summed over the trees from k onwards:
+        # after k trees the final margin lies in [partial + remaining_low[k], partial + remaining_high[k]]
+        is_leaf = self.left == np.arange(len(self.left))
+        low = np.minimum.reduceat(np.where(is_leaf, self.value, np.inf), self.roots).astype(np.float64)
+        high = np.maximum.reduceat(np.where(is_leaf, self.value, -np.inf), self.roots).astype(np.float64)
+        self.remaining_low = np.append(np.cumsum(low[::-1])[::-1], 0.0)
+        self.remaining_high = np.append(np.cumsum(high[::-1])[::-1], 0.0)
+
+    def to_arrays(self):
+        """Plain arrays for np.savez; from_arrays rebuilds the evaluator without parsing JSON."""
+        arrays = {name: getattr(self, name) for name in NODE_ARRAYS}
+        arrays['depth'] = np.int32(self.depth)
+        arrays['base_margin'] = np.float64(self.base_margin)
+        arrays['feature_names'] = np.array(self.feature_names or [], dtype=str)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        self = cls.__new__(cls)
+        for name in NODE_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.depth = int(arrays['depth'])
+        self.base_margin = float(arrays['base_margin'])
+        self.feature_names = [str(name) for name in arrays['feature_names']] or None
+        self._link()
+        return self
+
+    @staticmethod
+    def _depth(left, right):
+        depth = np.zeros(len(left), dtype=np.int32)
+        # Children always have larger ids than their parents in XGBoost dumps
+        for node in range(len(left)):
+            if left[node] != -1:
+                depth[left[node]] = depth[right[node]] = depth[node] + 1
+        return int(depth.max())
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith('.npz'):
+            with np.load(path) as arrays:
+                return cls.from_arrays(arrays)
+        with open(path) as f:
+            return cls(json.load(f))
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def _step(self, nodes, values, has_missing):
+        go_left = values < self.threshold.take(nodes)
+        if has_missing:
+            go_left = np.where(np.isnan(values), self.default_left.take(nodes), go_left)
+        return self.children.take(nodes * 2 + go_left)
+
+    def leaves(self, matrix, roots=None):
+        """Leaf node reached in every tree (or only the trees starting at `roots`), shape (n_rows, n_trees)."""
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        n_rows, n_features = matrix.shape
+        flat = matrix.ravel()
+        has_missing = bool(np.isnan(flat).any())
+        row_start = (np.arange(n_rows, dtype=np.int64) * n_features)[:, None]
+        roots = self.roots if roots is None else roots
+        nodes = np.broadcast_to(roots, (n_rows, len(roots))).copy()
+        for _ in range(self.depth):
+            nodes = self._step(nodes, flat.take(row_start + self.feature.take(nodes)), has_missing)
+        return nodes
+
+    def predict_margin(self, matrix):
+        return self.base_margin + self.value.take(self.leaves(matrix)).sum(axis=1, dtype=np.float64)
+
+    def predict(self, matrix):
+        """Probability of the positive class for each row, like booster.predict."""
+        return 1.0 / (1.0 + np.exp(-self.predict_margin(matrix)))
+
+    def predict_labels(self, matrix, chunk=25):
+        """Labels as int(round(p)) and the number of trees evaluated for each row.
+
+        Trees are evaluated `chunk` at a time. A row stops as soon as its partial margin plus
+        the smallest and largest possible contribution of the remaining trees falls on one
+        side of zero (p = 0.5). Rows that never get there are summed exactly like predict(),
+        so labels always match the full ensemble.
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        n_rows = len(matrix)
+        leaves = np.empty((n_rows, self.n_trees), dtype=self.roots.dtype)
+        partial = np.full(n_rows, self.base_margin)
+        evaluated = np.zeros(n_rows, dtype=np.int32)
+        labels = np.zeros(n_rows, dtype=np.int64)
+        active = np.arange(n_rows)
+        for start in range(0, self.n_trees, chunk):
+            stop = min(start + chunk, self.n_trees)
+            reached = self.leaves(matrix[active], self.roots[start:stop])
+            leaves[active, start:stop] = reached
+            partial[active] += self.value.take(reached).sum(axis=1, dtype=np.float64)
+            evaluated[active] = stop
+            if stop == self.n_trees:
+                break
+            # The slack keeps float rounding in the partial sums from deciding a close call
+            margin = partial[active]
+            positive = margin + self.remaining_low[stop] > DECISION_SLACK
+            negative = margin + self.remaining_high[stop] < -DECISION_SLACK
+            labels[active[positive]] = 1
+            active = active[~(positive | negative)]
+            if not len(active):
+                break
+        if len(active):
+            margin = self.base_margin + self.value.take(leaves[active]).sum(axis=1, dtype=np.float64)
+            labels[active] = np.round(1.0 / (1.0 + np.exp(-margin))).astype(np.int64)
+        return labels, evaluated
+
+    def predict_row(self, row):
+        """Single-row fast path: one cursor per tree, no 2-D indexing."""
+        row = np.asarray(row, dtype=np.float32)
+        has_missing = bool(np.isnan(row).any())
+        nodes = self.roots
+        for _ in range(self.depth):
+            nodes = self._step(nodes, row.take(self.feature.take(nodes)), has_missing)
+        margin = self.base_margin + float(self.value.take(nodes).sum(dtype=np.float64))
+        return 1.0 / (1.0 + math.exp(-margin))
+
+
+def check_against_xgboost(path, n_rows=20000, seed=0):
+    import xgboost as xgb
+    ensemble = TreeEnsemble.load(path)
+    booster = xgb.Booster()
+    booster.load_model(path)
+
+    n_features = int(booster.num_features())
+    rng = np.random.default_rng(seed)
+    thresholds = [ensemble.threshold[(ensemble.feature == f) & (ensemble.left != np.arange(len(ensemble.left)))]
+                  for f in range(n_features)]
+    matrix = np.zeros((n_rows, n_features), dtype=np.float32)
+    for f, values in enumerate(thresholds):
+        if len(values):
+            matrix[:, f] = rng.choice(values, n_rows) * rng.uniform(0, 2, n_rows)
+
+    expected = booster.predict(xgb.DMatrix(matrix, feature_names=ensemble.feature_names))
+    batch = ensemble.predict(matrix)
+    single = np.array([ensemble.predict_row(row) for row in matrix[:1000]])
+    labels, evaluated = ensemble.predict_labels(matrix, chunk=10)
+    label_mismatches = int((labels != np.round(batch)).sum())
+    return (float(np.abs(expected - batch).max()), float(np.abs(expected[:1000] - single).max()),
+            label_mismatches, float(evaluated.mean()))
+
+
+if __name__ == '__main__':
+    batch_diff, single_diff, label_mismatches, mean_trees = check_against_xgboost(
+        sys.argv[1] if len(sys.argv) > 1 else 'xgb_model_raw.json')
+    print(f"max |xgboost - numpy|: batch {batch_diff:.3g}, single-row {single_diff:.3g}")
+    print(f"early exit: {label_mismatches} label mismatches, {mean_trees:.1f} trees per row on average")
+    sys.exit(0 if max(batch_diff, single_diff) <= 1e-6 and not label_mismatches else 1)
@@ -0,0 +1,65 @@
+# filename: url_canonicalizer.py
+# Canonical form of a URL: the key for the verdict caches and for request coalescing.
+#
+# Spellings that fetch the same page share one key:
+#   scheme case                          HTTPS://example.com/x      -> https://example.com/x
+#   empty path                           https://example.com        -> https://example.com/
+#   fragment (never sent to the server)  /login#top                 -> /login
+#   tracking parameters                  /?utm_source=mail&id=1     -> /?id=1
+#   host case, default port (off)        http://Example.COM:80/x    -> http://example.com/x
+#   trailing slash (off)                 /login/                    -> /login
+# Each rule is switched by a PHISHSHIELD_CANONICAL_* setting in config.py.
+#
+# The URL-string model features (length, digit ratio, ...) differ between spellings, so
+# a verdict found under a key is respelled for the URL actually asked about (respell).
+# With the default rules that makes a shared verdict exactly the one a direct scan gives.
+# The two rules that are off are not exact: links are counted as self or external
+# against the host as spelled, and a server may redirect /login to /login/.
+#
+# python canonical_parity.py checks, on the pages in parity_pages/, that respelled
+# features match a direct scan of every spelling.
+
+from fnmatch import fnmatchcase
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+import config
+from url_feature_extractor import URLFeatureExtractor
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+DROP_PARAMS = [p.strip().lower() for p in config.CANONICAL_DROP_PARAMS.split(',') if p.strip()]
+
+
+def is_tracking_param(pair):
+    name = unquote_plus(pair.partition('=')[0]).lower()
+    return any(fnmatchcase(name, pattern) for pattern in DROP_PARAMS)
+
+
+def canonical_url(url):
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        # Unparsable (e.g. a bad port): only the exact same string shares the key
+        return url
+    scheme, netloc, path, query, fragment = parts  # urlsplit already lowercases the scheme
+
+    if config.CANONICAL_FOLD_HOST:
+        userinfo, at, host = netloc.rpartition('@')
+        host = host.lower()
+        if port is not None and DEFAULT_PORTS.get(scheme) == port:
+            host = host[:host.rindex(':')]
+        netloc = userinfo + at + host
+    if netloc and not path:
+        path = '/'  # both spellings request "GET /"
+    elif config.CANONICAL_TRAILING_SLASH and len(path) > 1:
+        path = path.rstrip('/') or '/'
+    if query and DROP_PARAMS:
+        query = '&'.join(pair for pair in query.split('&') if not is_tracking_param(pair))
+    if config.CANONICAL_DROP_FRAGMENT:
+        fragment = ''
+    return urlunsplit((scheme, netloc, path, query, fragment))
+
+
+def respell(features, url):
+    """features with the URL-string features recomputed from url; page-derived ones are kept."""
+    return {**features, **URLFeatureExtractor(url, fetch=False).extract_lexical_features()}
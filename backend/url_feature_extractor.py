@@ -2,27 +2,53 @@
 
 import re
 import socket
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin
-from tld import get_tld
+from urllib.parse import urlparse
+from fetcher import decode_page, fetch_page, get_session, header_charset
+from html_features import scan_tags
+from html_parsers import parse_html
+from metrics import stage
 
 class URLFeatureExtractor:
-    def __init__(self, url, timeout=10):
+    def __init__(self, url, timeout=10, response=None, session=None, parser=None, fetch=True):
         self.url = url
         self.timeout = timeout
+        self.session = session
+        self.parser = parser
         self.parsed_url = self.safe_parse(url)
         self.domain = self.parsed_url.netloc if self.parsed_url else ''
+        self.document = None
         self.soup = None
+        self._tag_features = None
         self.page_content = None
-        self.response = None
+        self.response = response
+        self.truncated = False
         self.error = None
 
+        if self.response is None and not fetch:
+            # URL-only use: nothing to download or parse
+            return
+
         try:
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            self.response = requests.get(url, headers=headers, timeout=self.timeout)
-            self.page_content = self.response.text
-            self.soup = BeautifulSoup(self.page_content, 'html.parser')
+            # A response fetched elsewhere (e.g. by the async fetcher) skips the blocking download
+            if self.response is None:
+                if self.session is None:
+                    self.session = get_session()
+                with stage('download'):
+                    self.response = fetch_page(self.session, url, self.timeout)
+            # Responses from fetcher carry a capped body; others (plain requests/httpx) are whole
+            self.truncated = getattr(self.response, 'truncated', False)
+            skipped = getattr(self.response, 'skipped', None)
+            if skipped:
+                # A PDF, executable, image... behind the URL: nothing to parse as HTML
+                self.error = f"Not an HTML page ({skipped})"
+                return
+            # Decoded from the raw bytes with the charset policy; response.text may run detection
+            self.page_content = decode_page(self.response.content,
+                                            header_charset(self.response.headers.get('Content-Type')))
+            with stage('parse'):
+                self.document = parse_html(self.page_content, self.parser)
+            # Only the BeautifulSoup backend has a soup; kept for callers that inspect it
+            self.soup = getattr(self.document, 'soup', None)
         except Exception as e:
             self.error = str(e)
 
@@ -39,6 +65,7 @@ class URLFeatureExtractor:
         return len(self.domain) if self.domain else 0
 
     def get_tld_length(self):
+        from tld import get_tld  # imported on first use to keep app import fast
         try:
             tld = get_tld(self.url, fail_silently=True)
             return len(tld) if tld else 0
@@ -53,40 +80,27 @@ class URLFeatureExtractor:
         digits = sum(c.isdigit() for c in self.url)
         return digits / len(self.url) if self.url else 0
 
+    @property
+    def tag_features(self):
+        # All tag-derived features come from a single walk over the document, done once
+        if self._tag_features is None:
+            self._tag_features = scan_tags(self.document, self.parsed_url)
+        return self._tag_features
+
     def get_no_of_images(self):
-        return len(self.soup.find_all('img')) if self.soup else 0
+        return self.tag_features.images
 
     def get_no_of_js(self):
-        return len(self.soup.find_all('script')) if self.soup else 0
+        return self.tag_features.scripts
 
     def get_no_of_css(self):
-        return len(self.soup.find_all('link', {'rel': 'stylesheet'})) if self.soup else 0
+        return self.tag_features.stylesheets
 
     def get_no_of_self_ref(self):
-        if not self.soup or not self.parsed_url:
-            return 0
-        base_url = f"{self.parsed_url.scheme}://{self.parsed_url.netloc}"
-        count = 0
-        for tag in self.soup.find_all(['a', 'link', 'script', 'img']):
-            url = tag.get('href') or tag.get('src')
-            if url:
-                full = urljoin(base_url, url)
-                if full.startswith(base_url):
-                    count += 1
-        return count
+        return self.tag_features.self_refs
 
     def get_no_of_external_ref(self):
-        if not self.soup or not self.parsed_url:
-            return 0
-        base_url = f"{self.parsed_url.scheme}://{self.parsed_url.netloc}"
-        count = 0
-        for tag in self.soup.find_all(['a', 'link', 'script', 'img']):
-            url = tag.get('href') or tag.get('src')
-            if url:
-                full = urljoin(base_url, url)
-                if not full.startswith(base_url) and urlparse(full).netloc:
-                    count += 1
-        return count
+        return self.tag_features.external_refs
 
     def is_https(self):
         return 1 if self.parsed_url and self.parsed_url.scheme == 'https' else 0
@@ -101,35 +115,32 @@ class URLFeatureExtractor:
         return 1 if any(re.search(p, self.page_content) for p in patterns) else 0
 
     def has_title(self):
-        return 1 if self.soup and self.soup.title and self.soup.title.string.strip() else 0
+        return self.tag_features.has_title
 
     def has_description(self):
-        tag = self.soup.find('meta', attrs={'name': 'description'}) if self.soup else None
-        return 1 if tag and tag.get('content', '').strip() else 0
+        return self.tag_features.has_description
 
     def has_submit_button(self):
-        if not self.soup:
-            return 0
-        return 1 if self.soup.find('input', {'type': 'submit'}) or self.soup.find('button') else 0
+        return 1 if self.tag_features.submit_button else 0
 
     def has_social_net(self):
-        if not self.soup:
+        if not self.document:
             return 0
-        return 1 if re.search(r'facebook|twitter|linkedin|instagram|youtube|pinterest', self.soup.decode(), re.I) else 0
+        return 1 if re.search(r'facebook|twitter|linkedin|instagram|youtube|pinterest', self.document.markup(), re.I) else 0
 
     def has_favicon(self):
-        return 1 if self.soup and self.soup.find('link', rel=re.compile('icon', re.I)) else 0
+        return 1 if self.tag_features.favicon else 0
 
     def has_copyright_info(self):
-        if not self.soup:
+        if not self.document:
             return 0
-        return 1 if re.search(r'copyright|©', self.soup.get_text(), re.I) else 0
+        return 1 if re.search(r'copyright|©', self.document.text(), re.I) else 0
 
     def has_popup_window(self):
         return 1 if self.page_content and re.search(r'window\.open\s*\(', self.page_content) else 0
 
     def has_iframe(self):
-        return 1 if self.soup and self.soup.find('iframe') else 0
+        return 1 if self.tag_features.iframe else 0
 
     def is_abnormal_url(self):
         if not self.url:
@@ -138,11 +149,23 @@ class URLFeatureExtractor:
         return 1 if any(re.search(p, self.url) for p in patterns) else 0
 
     def get_redirect_value(self):
-        if not self.response:
+        # Error statuses count as "no response", matching requests' Response.__bool__
+        if self.response is None or self.response.status_code >= 400:
             return 0
         return 1 if len(self.response.history)>0 else -1
         
 
+    def extract_lexical_features(self):
+        # The subset of model features computed from the URL string alone
+        return {
+            'URLLength': self.get_url_length(),
+            'DomainLength': self.get_domain_length(),
+            'TLDLength': self.get_tld_length(),
+            'IsHTTPS': self.is_https(),
+            'Abnormal_URL': self.is_abnormal_url(),
+            'LetterToDigitRatio': self.get_letter_ratio_in_url() / (self.get_digit_ratio_in_url() + 1e-5),
+        }
+
     def extract_model_features(self):
         if self.error:
             return {"error": self.error}
@@ -160,27 +183,29 @@ class URLFeatureExtractor:
             redirect_0 = 0
             redirect_1 = 1
 
-        return {
-            'URLLength': self.get_url_length(),
-            'DomainLength': self.get_domain_length(),
-            'TLDLength': self.get_tld_length(),
-            'NoOfImage': self.get_no_of_images(),
-            'NoOfJS': self.get_no_of_js(),
-            'NoOfCSS': self.get_no_of_css(),
-            'NoOfSelfRef': self.get_no_of_self_ref(),
-            'NoOfExternalRef': self.get_no_of_external_ref(),
-            'IsHTTPS': self.is_https(),
-            'HasObfuscation': self.has_obfuscation(),
-            'HasTitle': self.has_title(),
-            'HasDescription': self.has_description(),
-            'HasSubmitButton': self.has_submit_button(),
-            'HasSocialNet': self.has_social_net(),
-            'HasFavicon': self.has_favicon(),
-            'HasCopyrightInfo': self.has_copyright_info(),
-            'popUpWindow': self.has_popup_window(),
-            'Iframe': self.has_iframe(),
-            'Abnormal_URL': self.is_abnormal_url(),
-            'LetterToDigitRatio': self.get_letter_ratio_in_url() / (self.get_digit_ratio_in_url() + 1e-5),
-            'Redirect_0': redirect_0,
-            'Redirect_1': redirect_1
-        }
\ No newline at end of file
+        # Tag scan, regex checks and URL features; page parsing is timed separately as 'parse'
+        with stage('features'):
+            return {
+                'URLLength': self.get_url_length(),
+                'DomainLength': self.get_domain_length(),
+                'TLDLength': self.get_tld_length(),
+                'NoOfImage': self.get_no_of_images(),
+                'NoOfJS': self.get_no_of_js(),
+                'NoOfCSS': self.get_no_of_css(),
+                'NoOfSelfRef': self.get_no_of_self_ref(),
+                'NoOfExternalRef': self.get_no_of_external_ref(),
+                'IsHTTPS': self.is_https(),
+                'HasObfuscation': self.has_obfuscation(),
+                'HasTitle': self.has_title(),
+                'HasDescription': self.has_description(),
+                'HasSubmitButton': self.has_submit_button(),
+                'HasSocialNet': self.has_social_net(),
+                'HasFavicon': self.has_favicon(),
+                'HasCopyrightInfo': self.has_copyright_info(),
+                'popUpWindow': self.has_popup_window(),
+                'Iframe': self.has_iframe(),
+                'Abnormal_URL': self.is_abnormal_url(),
+                'LetterToDigitRatio': self.get_letter_ratio_in_url() / (self.get_digit_ratio_in_url() + 1e-5),
+                'Redirect_0': redirect_0,
+                'Redirect_1': redirect_1
+            }
\ No newline at end of file